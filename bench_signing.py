@@ -0,0 +1,75 @@
+"""
+签名热路径微基准测试
+
+对比原始实现与当前实现构建请求参数（含签名）的耗时，
+并估算在给定请求速率下签名占用的单核CPU比例。
+
+用法:
+    python bench_signing.py
+    python bench_signing.py -n 200000 --rate 1000
+"""
+import argparse
+import hashlib
+import time
+import timeit
+from unittest import mock
+from dianping_api import DianpingAPI
+
+
+def legacy_build_request_params(api: DianpingAPI, method: str, params: dict, timestamp: int = None) -> dict:
+    """原始实现：每次重建静态参数并通过 items() 排序拼接"""
+    if timestamp is None:
+        timestamp = int(time.time())
+    request_params = {
+        'appkey': api.api_key,
+        'method': method,
+        'timestamp': str(timestamp),
+        'format': 'json',
+        'v': '1.0',
+        **params
+    }
+    sorted_params = sorted(request_params.items())
+    query_string = '&'.join([f"{k}={v}" for k, v in sorted_params])
+    sign_string = f"{query_string}&key={api.api_secret}"
+    request_params['sign'] = hashlib.md5(sign_string.encode('utf-8')).hexdigest().upper()
+    return request_params
+
+
+def main():
+    """运行基准测试"""
+    parser = argparse.ArgumentParser(description='签名热路径微基准测试')
+    parser.add_argument('-n', '--number', type=int, default=100000, help='每轮调用次数 (默认: 100000)')
+    parser.add_argument('--repeat', type=int, default=5, help='重复轮数，取最快一轮 (默认: 5)')
+    parser.add_argument('--rate', type=int, default=1000, help='估算CPU占比所用的请求速率 req/s (默认: 1000)')
+    args = parser.parse_args()
+    
+    api = DianpingAPI(api_key='bench_key', api_secret='bench_secret')
+    method = 'shop.search'
+    params = {'keyword': '火锅', 'city': '北京', 'page': 3, 'page_size': 50}
+    
+    # 固定时间戳，两种实现的请求参数和签名必须完全一致
+    timestamp = 1700000000
+    expected = legacy_build_request_params(api, method, params, timestamp=timestamp)
+    with mock.patch('dianping_api.time.time', return_value=timestamp + 0.5):
+        actual = api._build_request_params(method, params)
+    assert expected == actual, "签名结果不一致"
+    
+    cases = [
+        ('原始实现', lambda: legacy_build_request_params(api, method, params)),
+        ('当前实现', lambda: api._build_request_params(method, params)),
+    ]
+    
+    results = {}
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+        per_call_us = best / args.number * 1e6
+        results[name] = per_call_us
+        cpu_share = per_call_us * args.rate / 1e6 * 100
+        print(f"{name}: {per_call_us:.2f} µs/次，{args.rate} req/s 时约占单核 {cpu_share:.2f}%")
+    
+    speedup = results['原始实现'] / results['当前实现']
+    print(f"加速比: {speedup:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,18 @@
 命令行界面
 """
 import argparse
+import multiprocessing
 import sys
+import time
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from config import Config
 from dianping_api import DianpingAPI
-from data_collector import DataCollector
+from data_collector import DataCollector, parse_output_format
+from scheduler import CrawlScheduler
+from task_queue import TaskQueue, run_worker
+from profiler import profiler, PROFILER_MODES
 
 console = Console()
 
@@ -24,18 +29,30 @@ def print_banner():
     console.print(Panel(banner, style="bold cyan"))
 
 
+def print_transfer_stats(api: DianpingAPI):
+    """打印本次运行的请求数和传输字节数"""
+    if not api.request_count:
+        return
+    received_kb = api.bytes_received / 1024
+    decoded_kb = api.bytes_decoded / 1024
+    ratio = api.bytes_decoded / api.bytes_received if api.bytes_received else 1
+    console.print(
+        f"[dim]共 {api.request_count} 次请求，接收 {received_kb:.1f} KB"
+        f"（解压后 {decoded_kb:.1f} KB，压缩比 {ratio:.1f}x）[/dim]"
+    )
+
+
 def search_shops(args):
     """搜索商户"""
     try:
         Config.validate()
+        api = DianpingAPI()
+        collector = DataCollector(api)
     except ValueError as e:
         console.print(f"[red]错误: {e}[/red]")
-        console.print("[yellow]请先配置 .env 文件中的 API 密钥[/yellow]")
+        console.print("[yellow]请检查 .env 文件中的配置[/yellow]")
         return
     
-    api = DianpingAPI()
-    collector = DataCollector(api)
-    
     console.print(f"[cyan]开始搜索商户...[/cyan]")
     console.print(f"关键词: {args.keyword or '无'}")
     console.print(f"城市: {args.city or '无'}")
@@ -51,29 +68,12 @@ def search_shops(args):
         max_pages=args.max_pages,
         page_size=args.page_size
     )
+    print_transfer_stats(api)
     
     if shops:
         # 显示结果表格
-        table = Table(title="搜索结果", show_header=True, header_style="bold magenta")
-        table.add_column("ID", style="dim")
-        table.add_column("名称")
-        table.add_column("地址", style="cyan")
-        table.add_column("评分", justify="right")
-        table.add_column("评论数", justify="right")
-        
-        for shop in shops[:10]:  # 只显示前10个
-            table.add_row(
-                str(shop.get('shop_id', '')),
-                shop.get('name', '')[:30],
-                shop.get('address', '')[:30],
-                str(shop.get('rating', '')),
-                str(shop.get('review_count', 0))
-            )
-        
-        console.print(table)
-        
-        if len(shops) > 10:
-            console.print(f"[dim]... 还有 {len(shops) - 10} 个结果未显示[/dim]")
+        with profiler.stage('render'):
+            render_shops(shops)
         
         # 保存数据
         if args.save:
@@ -83,17 +83,40 @@ def search_shops(args):
         console.print("[yellow]未找到相关商户[/yellow]")
 
 
+def render_shops(shops):
+    """显示商户结果表格"""
+    table = Table(title="搜索结果", show_header=True, header_style="bold magenta")
+    table.add_column("ID", style="dim")
+    table.add_column("名称")
+    table.add_column("地址", style="cyan")
+    table.add_column("评分", justify="right")
+    table.add_column("评论数", justify="right")
+    
+    for shop in shops[:10]:  # 只显示前10个
+        table.add_row(
+            str(shop.get('shop_id', '')),
+            shop.get('name', '')[:30],
+            shop.get('address', '')[:30],
+            str(shop.get('rating', '')),
+            str(shop.get('review_count', 0))
+        )
+    
+    console.print(table)
+    
+    if len(shops) > 10:
+        console.print(f"[dim]... 还有 {len(shops) - 10} 个结果未显示[/dim]")
+
+
 def get_shop_detail(args):
     """获取商户详情"""
     try:
         Config.validate()
+        api = DianpingAPI()
+        collector = DataCollector(api)
     except ValueError as e:
         console.print(f"[red]错误: {e}[/red]")
         return
     
-    api = DianpingAPI()
-    collector = DataCollector(api)
-    
     console.print(f"[cyan]正在获取商户 {args.shop_id} 的详情...[/cyan]")
     
     try:
@@ -112,7 +135,8 @@ def get_shop_detail(args):
 分类: {detail.get('category', '')}
 营业时间: {detail.get('open_time', '')}
             """
-            console.print(Panel(info, title="商户详情", border_style="green"))
+            with profiler.stage('render'):
+                console.print(Panel(info, title="商户详情", border_style="green"))
             
             # 保存数据
             if args.save:
@@ -128,13 +152,12 @@ def get_reviews(args):
     """获取商户评论"""
     try:
         Config.validate()
+        api = DianpingAPI()
+        collector = DataCollector(api)
     except ValueError as e:
         console.print(f"[red]错误: {e}[/red]")
         return
     
-    api = DianpingAPI()
-    collector = DataCollector(api)
-    
     console.print(f"[cyan]正在收集商户 {args.shop_id} 的评论...[/cyan]")
     
     reviews = collector.collect_shop_reviews(
@@ -142,30 +165,12 @@ def get_reviews(args):
         max_pages=args.max_pages,
         page_size=args.page_size
     )
+    print_transfer_stats(api)
     
     if reviews:
         # 显示评论表格
-        table = Table(title="评论列表", show_header=True, header_style="bold magenta")
-        table.add_column("用户", style="cyan")
-        table.add_column("评分", justify="right")
-        table.add_column("评论内容", style="dim")
-        table.add_column("时间", style="dim")
-        
-        for review in reviews[:10]:  # 只显示前10条
-            content = review.get('content', '')
-            if len(content) > 50:
-                content = content[:50] + '...'
-            table.add_row(
-                review.get('user_name', ''),
-                str(review.get('rating', '')),
-                content,
-                review.get('date', '')
-            )
-        
-        console.print(table)
-        
-        if len(reviews) > 10:
-            console.print(f"[dim]... 还有 {len(reviews) - 10} 条评论未显示[/dim]")
+        with profiler.stage('render'):
+            render_reviews(reviews)
         
         # 保存数据
         if args.save:
@@ -174,6 +179,299 @@ def get_reviews(args):
         console.print("[yellow]未找到评论[/yellow]")
 
 
+def render_reviews(reviews):
+    """显示评论表格"""
+    table = Table(title="评论列表", show_header=True, header_style="bold magenta")
+    table.add_column("用户", style="cyan")
+    table.add_column("评分", justify="right")
+    table.add_column("评论内容", style="dim")
+    table.add_column("时间", style="dim")
+    
+    for review in reviews[:10]:  # 只显示前10条
+        content = review.get('content', '')
+        if len(content) > 50:
+            content = content[:50] + '...'
+        table.add_row(
+            review.get('user_name', ''),
+            str(review.get('rating', '')),
+            content,
+            review.get('date', '')
+        )
+    
+    console.print(table)
+    
+    if len(reviews) > 10:
+        console.print(f"[dim]... 还有 {len(reviews) - 10} 条评论未显示[/dim]")
+
+
+def _task_params(args):
+    """根据任务类型从命令行参数构建收集参数"""
+    if args.task_type in ('detail', 'reviews') and not args.shop_id:
+        raise ValueError(f"{args.task_type} 任务需要指定 --shop-id")
+    
+    fields = {
+        'search': ('keyword', 'city', 'category', 'region', 'max_pages'),
+        'detail': ('shop_id',),
+        'reviews': ('shop_id', 'max_pages'),
+        'deals': ('city', 'category', 'max_pages'),
+    }[args.task_type]
+    return {name: getattr(args, name) for name in fields if getattr(args, name) is not None}
+
+
+def _add_task_arguments(parser):
+    """为添加任务的子命令注册任务类型和收集参数"""
+    parser.add_argument('task_type', choices=['search', 'detail', 'reviews', 'deals'], help='任务类型')
+    parser.add_argument('-k', '--keyword', help='搜索关键词')
+    parser.add_argument('-c', '--city', help='城市名称')
+    parser.add_argument('--category', help='分类')
+    parser.add_argument('-r', '--region', help='区域')
+    parser.add_argument('--shop-id', help='商户ID（detail/reviews 任务）')
+    parser.add_argument('--max-pages', type=int, help='最大页数')
+
+
+def schedule_add(args):
+    """添加定时任务"""
+    scheduler = CrawlScheduler()
+    try:
+        task_id = scheduler.add_task(
+            args.task_type,
+            _task_params(args),
+            interval=args.interval,
+            importance=args.importance
+        )
+    except ValueError as e:
+        console.print(f"[red]错误: {e}[/red]")
+        return
+    finally:
+        scheduler.close()
+    
+    console.print(f"[green]已添加任务 {task_id}[/green]")
+
+
+def schedule_list(args):
+    """列出定时任务"""
+    scheduler = CrawlScheduler()
+    tasks = scheduler.list_tasks()
+    scheduler.close()
+    
+    if not tasks:
+        console.print("[yellow]暂无定时任务[/yellow]")
+        return
+    
+    table = Table(title="定时任务（按优先级排序）", show_header=True, header_style="bold magenta")
+    table.add_column("ID", style="dim")
+    table.add_column("类型")
+    table.add_column("参数", style="cyan")
+    table.add_column("间隔(秒)", justify="right")
+    table.add_column("重要度", justify="right")
+    table.add_column("过期程度", justify="right")
+    table.add_column("上次状态")
+    
+    for task in tasks:
+        staleness = task['staleness']
+        table.add_row(
+            str(task['id']),
+            task['task_type'],
+            str(task['params']),
+            str(task['interval']),
+            f"{task['importance']:g}",
+            '从未运行' if staleness == float('inf') else f"{staleness:.2f}",
+            task['last_status'] or '-'
+        )
+    
+    console.print(table)
+
+
+def schedule_remove(args):
+    """删除定时任务"""
+    scheduler = CrawlScheduler()
+    removed = scheduler.remove_task(args.task_id)
+    scheduler.close()
+    
+    if removed:
+        console.print(f"[green]已删除任务 {args.task_id}[/green]")
+    else:
+        console.print(f"[yellow]任务 {args.task_id} 不存在[/yellow]")
+
+
+def schedule_run(args):
+    """运行调度器"""
+    try:
+        Config.validate()
+        scheduler = CrawlScheduler()
+    except ValueError as e:
+        console.print(f"[red]错误: {e}[/red]")
+        return
+    
+    console.print(f"[cyan]调度器已启动，任务库: {scheduler.db_path}[/cyan]")
+    try:
+        scheduler.run(poll_interval=args.poll_interval, once=args.once, save=not args.no_save)
+    except KeyboardInterrupt:
+        console.print("[yellow]调度器已停止[/yellow]")
+    finally:
+        scheduler.close()
+
+
+def queue_add(args):
+    """投递队列任务"""
+    try:
+        params = _task_params(args)
+    except ValueError as e:
+        console.print(f"[red]错误: {e}[/red]")
+        return
+    
+    if args.expand:
+        if args.task_type != 'search':
+            console.print("[red]错误: --expand 只能用于 search 任务[/red]")
+            return
+        params['expand'] = args.expand
+    
+    queue = TaskQueue()
+    task_id = queue.enqueue(args.task_type, params)
+    queue.close()
+    console.print(f"[green]已投递任务 {task_id}[/green]")
+
+
+def queue_status(args):
+    """查看队列状态"""
+    queue = TaskQueue()
+    stats = queue.stats()
+    tasks = queue.list_tasks(status=args.status, limit=args.limit)
+    queue.close()
+    
+    console.print(
+        f"待处理: {stats['pending']}  执行中: {stats['leased']}  "
+        f"已完成: {stats['done']}  失败: {stats['failed']}"
+    )
+    
+    if not tasks:
+        return
+    
+    table = Table(title="队列任务", show_header=True, header_style="bold magenta")
+    table.add_column("ID", style="dim")
+    table.add_column("类型")
+    table.add_column("参数", style="cyan")
+    table.add_column("状态")
+    table.add_column("尝试次数", justify="right")
+    table.add_column("工作进程", style="dim")
+    table.add_column("错误", style="red")
+    
+    for task in tasks:
+        table.add_row(
+            str(task['id']),
+            task['task_type'],
+            str(task['params']),
+            task['status'],
+            f"{task['attempts']}/{task['max_attempts']}",
+            task['worker_id'] or '-',
+            (task['last_error'] or '')[:30]
+        )
+    
+    console.print(table)
+
+
+def queue_worker(args):
+    """启动队列工作进程"""
+    try:
+        Config.validate()
+        # 各工作进程创建收集器时也会检查，这里提前检查以免每个进程分别报错
+        parse_output_format()
+    except ValueError as e:
+        console.print(f"[red]错误: {e}[/red]")
+        return
+    
+    worker_kwargs = {
+        'poll_interval': args.poll_interval,
+        'exit_when_empty': args.exit_when_empty,
+        'save': not args.no_save,
+    }
+    
+    if args.processes <= 1:
+        run_worker(**worker_kwargs)
+        return
+    
+    console.print(f"[cyan]启动 {args.processes} 个工作进程...[/cyan]")
+    processes = [
+        multiprocessing.Process(target=run_worker, kwargs=worker_kwargs)
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        console.print("[yellow]正在停止工作进程...[/yellow]")
+        for process in processes:
+            process.join()
+
+
+def queue_coordinator(args):
+    """运行协调进程：定期回收过期租约并汇报进度"""
+    queue = TaskQueue()
+    console.print(f"[cyan]协调进程已启动，队列库: {queue.db_path}[/cyan]")
+    try:
+        while True:
+            reclaimed = queue.reclaim_expired()
+            if reclaimed:
+                console.print(f"[yellow]已回收 {reclaimed} 个租约过期的任务[/yellow]")
+            stats = queue.stats()
+            console.print(
+                f"待处理: {stats['pending']}  执行中: {stats['leased']}  "
+                f"已完成: {stats['done']}  失败: {stats['failed']}"
+            )
+            if args.exit_when_done and not stats['pending'] and not stats['leased']:
+                return
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        console.print("[yellow]协调进程已停止[/yellow]")
+    finally:
+        queue.close()
+
+
+def print_profile_report(top: int):
+    """打印性能分析结果并保存原始分析数据"""
+    table = Table(title=f"阶段耗时（总计 {profiler.total_time:.3f} 秒）", show_header=True, header_style="bold magenta")
+    table.add_column("阶段")
+    table.add_column("次数", justify="right")
+    table.add_column("总耗时(秒)", justify="right")
+    table.add_column("自身耗时(秒)", justify="right")
+    table.add_column("占比", justify="right")
+    
+    for item in profiler.stage_summary():
+        table.add_row(
+            item['stage'],
+            '-' if item['calls'] is None else str(item['calls']),
+            f"{item['total_time']:.3f}",
+            f"{item['self_time']:.3f}",
+            f"{item['share']:.1%}"
+        )
+    
+    console.print(table)
+    
+    functions = profiler.top_functions(top)
+    if functions:
+        table = Table(title=f"热点函数 Top {top}（{profiler.mode}）", show_header=True, header_style="bold magenta")
+        table.add_column("函数")
+        table.add_column("调用次数", justify="right")
+        table.add_column("自身耗时(秒)", justify="right")
+        table.add_column("累计耗时(秒)", justify="right")
+        
+        for item in functions:
+            table.add_row(
+                item['function'],
+                '-' if item['calls'] is None else str(item['calls']),
+                f"{item['self_time']:.3f}",
+                f"{item['total_time']:.3f}"
+            )
+        
+        console.print(table)
+    
+    filepath = profiler.save(Config.DATA_DIR)
+    if filepath:
+        console.print(f"[dim]原始分析数据已保存到: {filepath}[/dim]")
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(
@@ -181,6 +479,11 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
     
+    parser.add_argument('--profile', action='store_true', help='统计各处理阶段耗时')
+    parser.add_argument('--profiler', choices=PROFILER_MODES,
+                        help='同时运行 cProfile 或采样分析器并保存原始数据（隐含 --profile）')
+    parser.add_argument('--profile-top', type=int, default=20, help='显示的热点函数数量 (默认: 20)')
+    
     subparsers = parser.add_subparsers(dest='command', help='可用命令')
     
     # 搜索商户命令
@@ -190,7 +493,7 @@ def main():
     search_parser.add_argument('--category', help='分类')
     search_parser.add_argument('-r', '--region', help='区域')
     search_parser.add_argument('--max-pages', type=int, default=10, help='最大页数 (默认: 10)')
-    search_parser.add_argument('--page-size', type=int, default=20, help='每页数量 (默认: 20)')
+    search_parser.add_argument('--page-size', type=int, help='每页数量 (默认: 自动使用服务端允许的最大值)')
     search_parser.add_argument('-s', '--save', action='store_true', help='保存结果到文件')
     search_parser.add_argument('-o', '--output', help='输出文件名（不含扩展名）')
     search_parser.set_defaults(func=search_shops)
@@ -206,11 +509,61 @@ def main():
     review_parser = subparsers.add_parser('reviews', help='获取商户评论')
     review_parser.add_argument('shop_id', help='商户ID')
     review_parser.add_argument('--max-pages', type=int, default=5, help='最大页数 (默认: 5)')
-    review_parser.add_argument('--page-size', type=int, default=20, help='每页数量 (默认: 20)')
+    review_parser.add_argument('--page-size', type=int, help='每页数量 (默认: 自动使用服务端允许的最大值)')
     review_parser.add_argument('-s', '--save', action='store_true', help='保存结果到文件')
     review_parser.add_argument('-o', '--output', help='输出文件名（不含扩展名）')
     review_parser.set_defaults(func=get_reviews)
     
+    # 定时调度命令
+    schedule_parser = subparsers.add_parser('schedule', help='定时调度周期性收集任务')
+    schedule_subparsers = schedule_parser.add_subparsers(dest='schedule_command', help='调度操作')
+    
+    schedule_add_parser = schedule_subparsers.add_parser('add', help='添加定时任务')
+    _add_task_arguments(schedule_add_parser)
+    schedule_add_parser.add_argument('--interval', type=int, default=86400, help='刷新间隔秒数 (默认: 86400)')
+    schedule_add_parser.add_argument('--importance', type=float, default=1.0, help='重要度，越大越优先 (默认: 1.0)')
+    schedule_add_parser.set_defaults(func=schedule_add)
+    
+    schedule_list_parser = schedule_subparsers.add_parser('list', help='列出定时任务')
+    schedule_list_parser.set_defaults(func=schedule_list)
+    
+    schedule_remove_parser = schedule_subparsers.add_parser('remove', help='删除定时任务')
+    schedule_remove_parser.add_argument('task_id', type=int, help='任务ID')
+    schedule_remove_parser.set_defaults(func=schedule_remove)
+    
+    schedule_run_parser = schedule_subparsers.add_parser('run', help='运行调度器')
+    schedule_run_parser.add_argument('--poll-interval', type=float, default=60, help='空闲时最长休眠秒数 (默认: 60)')
+    schedule_run_parser.add_argument('--once', action='store_true', help='只执行当前到期的任务后退出')
+    schedule_run_parser.add_argument('--no-save', action='store_true', help='不保存收集结果')
+    schedule_run_parser.set_defaults(func=schedule_run)
+    
+    # 分布式队列命令
+    queue_parser = subparsers.add_parser('queue', help='基于共享队列的分布式收集')
+    queue_subparsers = queue_parser.add_subparsers(dest='queue_command', help='队列操作')
+    
+    queue_add_parser = queue_subparsers.add_parser('add', help='投递任务')
+    _add_task_arguments(queue_add_parser)
+    queue_add_parser.add_argument('--expand', nargs='+', choices=['detail', 'reviews'],
+                                  help='search 任务完成后为每个商户投递的后续任务')
+    queue_add_parser.set_defaults(func=queue_add)
+    
+    queue_status_parser = queue_subparsers.add_parser('status', help='查看队列状态')
+    queue_status_parser.add_argument('--status', choices=['pending', 'leased', 'done', 'failed'], help='按状态过滤')
+    queue_status_parser.add_argument('--limit', type=int, default=20, help='最多显示条数 (默认: 20)')
+    queue_status_parser.set_defaults(func=queue_status)
+    
+    queue_worker_parser = queue_subparsers.add_parser('worker', help='启动工作进程')
+    queue_worker_parser.add_argument('-p', '--processes', type=int, default=1, help='本机启动的工作进程数 (默认: 1)')
+    queue_worker_parser.add_argument('--poll-interval', type=float, default=5, help='队列为空时的轮询秒数 (默认: 5)')
+    queue_worker_parser.add_argument('--exit-when-empty', action='store_true', help='队列为空时退出')
+    queue_worker_parser.add_argument('--no-save', action='store_true', help='不保存收集结果')
+    queue_worker_parser.set_defaults(func=queue_worker)
+    
+    queue_coordinator_parser = queue_subparsers.add_parser('coordinator', help='运行协调进程（回收崩溃进程的任务）')
+    queue_coordinator_parser.add_argument('--interval', type=float, default=30, help='检查间隔秒数 (默认: 30)')
+    queue_coordinator_parser.add_argument('--exit-when-done', action='store_true', help='所有任务结束后退出')
+    queue_coordinator_parser.set_defaults(func=queue_coordinator)
+    
     args = parser.parse_args()
     
     if not args.command:
@@ -218,8 +571,26 @@ def main():
         parser.print_help()
         return
     
+    if args.command == 'schedule' and not args.schedule_command:
+        schedule_parser.print_help()
+        return
+    
+    if args.command == 'queue' and not args.queue_command:
+        queue_parser.print_help()
+        return
+    
     print_banner()
-    args.func(args)
+    
+    if not (args.profile or args.profiler):
+        args.func(args)
+        return
+    
+    profiler.start(args.profiler)
+    try:
+        args.func(args)
+    finally:
+        profiler.stop()
+        print_profile_report(args.profile_top)
 
 
 if __name__ == '__main__':
@@ -17,11 +17,32 @@ class Config:
     
     # 数据存储配置
     DATA_DIR = os.getenv('DATA_DIR', 'data')
-    OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'xlsx')  # xlsx, csv, json
+    OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'xlsx')  # xlsx, csv, json, jsonl，可加 .gz/.zst 压缩后缀
+    
+    # 内存配置
+    MEMORY_LIMIT_MB = float(os.getenv('MEMORY_LIMIT_MB', '0'))  # 每个结果缓冲的内存上限，超出后溢写到磁盘，0 表示不限制
+    SPILL_DIR = os.getenv('SPILL_DIR', '')  # 溢写临时文件目录，为空时使用系统临时目录
     
     # 请求配置
     REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', '30'))
     MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))
+    ACCEPT_ENCODING = os.getenv('ACCEPT_ENCODING', '')  # 为空时声明所有可解码的压缩编码
+    
+    # 分页配置
+    DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '20'))  # 服务端一定接受的页大小
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '100'))  # 自动探测页大小的上限
+    
+    # 调度配置
+    SCHEDULER_DB = os.getenv('SCHEDULER_DB', os.path.join(DATA_DIR, 'scheduler.db'))
+    API_BUDGET_REQUESTS = int(os.getenv('API_BUDGET_REQUESTS', '1000'))  # 每个窗口内最多请求数，0 表示不限制
+    API_BUDGET_WINDOW = int(os.getenv('API_BUDGET_WINDOW', '3600'))  # 预算窗口（秒）
+    SCHEDULER_RETRY_SECONDS = int(os.getenv('SCHEDULER_RETRY_SECONDS', '60'))  # 出错任务首次重试的等待时间（秒），之后指数退避
+    
+    # 分布式队列配置
+    QUEUE_DB = os.getenv('QUEUE_DB', os.path.join(DATA_DIR, 'queue.db'))
+    QUEUE_LEASE_SECONDS = int(os.getenv('QUEUE_LEASE_SECONDS', '300'))  # 任务租约时长（秒）
+    QUEUE_MAX_ATTEMPTS = int(os.getenv('QUEUE_MAX_ATTEMPTS', '3'))  # 单个任务最多尝试次数
+    QUEUE_RETRY_SECONDS = int(os.getenv('QUEUE_RETRY_SECONDS', '60'))  # 失败任务首次重试的等待时间（秒），之后指数退避
     
     @classmethod
     def validate(cls):
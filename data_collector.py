@@ -2,12 +2,93 @@
 数据收集和存储模块
 """
 import os
+import csv
+import gzip
 import json
-import pandas as pd
-from typing import List, Dict, Any
+import functools
+import textwrap
+from typing import List, Dict, Any, Tuple, Optional, Callable, Iterable
 from datetime import datetime
 from config import Config
-from dianping_api import DianpingAPI
+from dianping_api import DianpingAPI, APIError
+from profiler import profiler
+from record_buffer import RecordBuffer
+from openpyxl import Workbook
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，仅输出 .zst 文件时需要
+    zstandard = None
+
+
+TASK_TYPES = ('search', 'detail', 'reviews', 'deals')
+OUTPUT_FORMATS = ('json', 'jsonl', 'csv', 'xlsx')
+COMPRESSION_SUFFIXES = ('gz', 'zst')
+
+
+def parse_output_format(output_format: str = None) -> Tuple[str, str]:
+    """
+    解析并检查输出格式（如 jsonl.gz），以便在开始收集前发现配置错误
+    
+    Args:
+        output_format: 输出格式（不传则使用 OUTPUT_FORMAT）
+        
+    Returns:
+        (文件格式, 压缩后缀)，不压缩时压缩后缀为空
+    """
+    output_format = output_format or Config.OUTPUT_FORMAT
+    file_format, dot, compression = output_format.partition('.')
+    if file_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}（可选: {', '.join(OUTPUT_FORMATS)}）")
+    if dot and compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"不支持的压缩格式: {compression}（可选: {', '.join(COMPRESSION_SUFFIXES)}）")
+    if compression and file_format == 'xlsx':
+        raise ValueError("xlsx 已是压缩格式，不支持再压缩")
+    if compression == 'zst' and zstandard is None:
+        raise ValueError("输出 .zst 文件需要安装 zstandard: pip install zstandard")
+    return file_format, compression
+
+
+def _open_output(filepath: str, compression: str, encoding: str):
+    """
+    以文本模式打开输出文件，按需套上压缩流
+    
+    Args:
+        filepath: 文件路径
+        compression: 压缩后缀（gz、zst），为空表示不压缩
+        encoding: 文本编码
+        
+    Returns:
+        可写的文本文件对象
+    """
+    if compression == 'gz':
+        return gzip.open(filepath, 'wt', encoding=encoding, newline='')
+    if compression == 'zst':
+        return zstandard.open(filepath, 'wt', encoding=encoding, newline='')
+    return open(filepath, 'w', encoding=encoding, newline='')
+
+
+def _fieldnames(data: Iterable[Dict[str, Any]]) -> List[str]:
+    """
+    获取导出的列名（按字段首次出现的顺序）
+    
+    Args:
+        data: 记录列表或 RecordBuffer
+        
+    Returns:
+        列名列表
+    """
+    fields = getattr(data, 'fields', None)
+    if fields is not None:
+        return list(fields)
+    return list(dict.fromkeys(key for record in data for key in record))
+
+
+def _excel_value(value: Any) -> Any:
+    """将嵌套的字典/列表转换为 JSON 字符串，以便写入 Excel 单元格"""
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
 
 
 class DataCollector:
@@ -23,6 +104,10 @@ class DataCollector:
         self.api = api_client or DianpingAPI()
         self.data_dir = Config.DATA_DIR
         self.output_format = Config.OUTPUT_FORMAT
+        # 在发出任何请求之前检查输出格式，避免收集完成后才因配置错误丢失数据
+        self._file_format, self._compression = parse_output_format(self.output_format)
+        # 各API方法探测到的最大页大小
+        self._page_sizes = {}
         
         # 确保数据目录存在
         os.makedirs(self.data_dir, exist_ok=True)
@@ -33,7 +118,8 @@ class DataCollector:
                      category: str = None,
                      region: str = None,
                      max_pages: int = 10,
-                     page_size: int = 20) -> List[Dict[str, Any]]:
+                     page_size: int = None,
+                     raise_errors: bool = False) -> RecordBuffer:
         """
         收集商户信息
         
@@ -43,49 +129,33 @@ class DataCollector:
             category: 分类
             region: 区域
             max_pages: 最大收集页数
-            page_size: 每页数量
+            page_size: 每页数量（不传则自动使用服务端允许的最大值）
+            raise_errors: 请求出错时抛出异常（默认打印错误并返回已收集的部分）
             
         Returns:
             商户信息列表
         """
-        all_shops = []
-        
-        for page in range(1, max_pages + 1):
-            try:
-                result = self.api.search_shops(
-                    keyword=keyword,
-                    city=city,
-                    category=category,
-                    region=region,
-                    page=page,
-                    page_size=page_size
-                )
-                
-                # 根据实际API响应结构调整
-                shops = result.get('data', {}).get('shops', [])
-                if not shops:
-                    break
-                    
-                all_shops.extend(shops)
-                print(f"已收集第 {page} 页，共 {len(shops)} 个商户")
-                
-            except Exception as e:
-                print(f"收集第 {page} 页时出错: {str(e)}")
-                break
-        
-        return all_shops
+        fetch = functools.partial(
+            self.api.search_shops,
+            keyword=keyword,
+            city=city,
+            category=category,
+            region=region
+        )
+        return self._paginate(fetch, 'shop.search', 'shops', '商户', max_pages, page_size, raise_errors)
     
-    def collect_shop_details(self, shop_ids: List[str]) -> List[Dict[str, Any]]:
+    def collect_shop_details(self, shop_ids: List[str], raise_errors: bool = False) -> RecordBuffer:
         """
         收集商户详情
         
         Args:
             shop_ids: 商户ID列表
+            raise_errors: 请求出错时抛出异常（默认打印错误并跳过该商户）
             
         Returns:
             商户详情列表
         """
-        details = []
+        details = RecordBuffer()
         
         for shop_id in shop_ids:
             try:
@@ -95,6 +165,8 @@ class DataCollector:
                     details.append(detail)
                 print(f"已收集商户 {shop_id} 的详情")
             except Exception as e:
+                if raise_errors:
+                    raise
                 print(f"收集商户 {shop_id} 详情时出错: {str(e)}")
         
         return details
@@ -102,81 +174,269 @@ class DataCollector:
     def collect_shop_reviews(self,
                             shop_id: str,
                             max_pages: int = 5,
-                            page_size: int = 20) -> List[Dict[str, Any]]:
+                            page_size: int = None,
+                            raise_errors: bool = False) -> RecordBuffer:
         """
         收集商户评论
         
         Args:
             shop_id: 商户ID
             max_pages: 最大收集页数
-            page_size: 每页数量
+            page_size: 每页数量（不传则自动使用服务端允许的最大值）
+            raise_errors: 请求出错时抛出异常（默认打印错误并返回已收集的部分）
             
         Returns:
             评论列表
         """
-        all_reviews = []
+        fetch = functools.partial(self.api.get_shop_reviews, shop_id=shop_id)
+        return self._paginate(fetch, 'review.getList', 'reviews', '评论', max_pages, page_size, raise_errors)
+    
+    def collect_deals(self,
+                      city: str = None,
+                      category: str = None,
+                      max_pages: int = 5,
+                      page_size: int = None,
+                      raise_errors: bool = False) -> RecordBuffer:
+        """
+        收集团购/优惠信息
+        
+        Args:
+            city: 城市名称
+            category: 分类
+            max_pages: 最大收集页数
+            page_size: 每页数量（不传则自动使用服务端允许的最大值）
+            raise_errors: 请求出错时抛出异常（默认打印错误并返回已收集的部分）
+            
+        Returns:
+            团购列表
+        """
+        fetch = functools.partial(self.api.search_deals, city=city, category=category)
+        return self._paginate(fetch, 'deal.search', 'deals', '团购', max_pages, page_size, raise_errors)
+    
+    def _paginate(self,
+                  fetch: Callable[..., Dict[str, Any]],
+                  method: str,
+                  list_key: str,
+                  label: str,
+                  max_pages: int,
+                  page_size: int = None,
+                  raise_errors: bool = False) -> RecordBuffer:
+        """
+        分页收集列表数据
+        
+        未指定页大小时，首次调用某个方法会从 MAX_PAGE_SIZE 开始探测服务端接受的最大页大小
+        （被服务端以 4xx 或错误码拒绝则减半，不低于 DEFAULT_PAGE_SIZE），确认后按方法缓存。
+        根据响应中的 has_more/total 元数据提前结束；没有元数据时，只有页大小确认被服务端完整接受后，
+        不满一页才视为最后一页，否则按本页条数再请求一页确认，避免服务端静默截断页大小时丢失数据。
+        
+        Args:
+            fetch: 接受 page 和 page_size 参数的API调用
+            method: API方法名（页大小缓存的键）
+            list_key: 响应 data 中列表字段名
+            label: 日志中的数据名称
+            max_pages: 最大收集页数
+            page_size: 每页数量（不传则自动探测）
+            raise_errors: 请求出错时抛出异常，而不是打印错误并返回已收集的部分
+            
+        Returns:
+            收集到的记录列表
+        """
+        probing = page_size is None and method not in self._page_sizes
+        # 页大小是否已确认被服务端完整接受（缓存值已确认过）
+        confirmed = page_size is None and not probing
+        if page_size is None:
+            page_size = self._page_sizes.get(method, Config.MAX_PAGE_SIZE)
+        
+        all_items = RecordBuffer()
+        page = 1
         
-        for page in range(1, max_pages + 1):
+        while page <= max_pages:
             try:
-                result = self.api.get_shop_reviews(
-                    shop_id=shop_id,
-                    page=page,
-                    page_size=page_size
-                )
-                
-                reviews = result.get('data', {}).get('reviews', [])
-                if not reviews:
-                    break
-                    
-                all_reviews.extend(reviews)
-                print(f"已收集第 {page} 页评论，共 {len(reviews)} 条")
-                
+                result = fetch(page=page, page_size=page_size)
+                if probing and 'data' not in result:
+                    # 返回错误码而没有数据，视为服务端拒绝了该页大小
+                    raise APIError(f"响应缺少 data 字段: {result}", rejected=True)
             except Exception as e:
-                print(f"收集第 {page} 页评论时出错: {str(e)}")
+                # 探测阶段只有服务端明确拒绝（4xx 或错误码响应）时才减半重试；
+                # 超时、5xx 等临时故障与页大小无关，按普通错误处理，也不会缓存页大小
+                if (probing and page == 1 and page_size > Config.DEFAULT_PAGE_SIZE
+                        and getattr(e, 'rejected', False)):
+                    page_size = max(page_size // 2, Config.DEFAULT_PAGE_SIZE)
+                    continue
+                if raise_errors:
+                    raise
+                print(f"收集第 {page} 页{label}时出错: {str(e)}")
                 break
+            
+            data = result.get('data') or {}
+            items = data.get(list_key, [])
+            if not items:
+                break
+            
+            all_items.extend(items)
+            print(f"已收集第 {page} 页{label}，共 {len(items)} 条")
+            
+            has_more, total = self._page_metadata(data)
+            short = len(items) < page_size
+            
+            if has_more is not None or total is not None:
+                more = has_more if has_more is not None else total > len(all_items)
+                # 不满一页但元数据表明还有更多，说明服务端把页大小截断到了本页条数
+                if short and more:
+                    page_size = len(items)
+                verified = True
+            elif short and not confirmed:
+                # 可能是服务端静默截断了页大小：按本页条数再请求一页，有数据才说明确实被截断
+                page_size = len(items)
+                more = True
+                verified = False
+            else:
+                # 页大小已确认时，不满一页即为最后一页
+                more = not short
+                verified = not short or page > 1
+            
+            confirmed = True
+            if probing and verified:
+                self._page_sizes[method] = page_size
+                probing = False
+            
+            if not more:
+                break
+            
+            page += 1
+        
+        return all_items
+    
+    @staticmethod
+    def _page_metadata(data: Dict[str, Any]) -> Tuple[Optional[bool], Optional[int]]:
+        """
+        读取响应中的分页元数据
+        
+        Args:
+            data: 响应中的 data 字段
+            
+        Returns:
+            (是否还有更多, 总条数)，缺失时为 None
+        """
+        has_more = None
+        for key in ('has_more', 'has_next'):
+            if data.get(key) is not None:
+                has_more = bool(data[key])
+                break
+        
+        total = None
+        for key in ('total', 'total_count'):
+            if data.get(key) is not None:
+                try:
+                    total = int(data[key])
+                except (TypeError, ValueError):
+                    continue
+                break
+        
+        return has_more, total
+    
+    def collect_task(self,
+                     task_type: str,
+                     params: Dict[str, Any],
+                     raise_errors: bool = False) -> Tuple[RecordBuffer, str]:
+        """
+        按任务类型执行一次收集（供调度器/工作进程使用）
         
-        return all_reviews
+        Args:
+            task_type: 任务类型（search, detail, reviews, deals）
+            params: 对应收集方法的参数
+            raise_errors: 请求出错时抛出异常，以便调用方记录失败并重试
+            
+        Returns:
+            (收集到的记录, 数据类型)
+        """
+        if task_type == 'search':
+            return self.flatten_shop_data(self.collect_shops(raise_errors=raise_errors, **params)), 'shops'
+        if task_type == 'detail':
+            return self.collect_shop_details([params['shop_id']], raise_errors=raise_errors), 'shop_detail'
+        if task_type == 'reviews':
+            return self.collect_shop_reviews(raise_errors=raise_errors, **params), 'reviews'
+        if task_type == 'deals':
+            return self.collect_deals(raise_errors=raise_errors, **params), 'deals'
+        raise ValueError(f"未知的任务类型: {task_type}")
     
-    def save_data(self, data: List[Dict[str, Any]], filename: str = None, data_type: str = 'shops'):
+    def save_data(self, data: Iterable[Dict[str, Any]], filename: str = None, data_type: str = 'shops') -> Optional[str]:
         """
         保存数据到文件
         
+        输出格式由 OUTPUT_FORMAT 决定，可追加压缩后缀，例如 jsonl.gz、csv.zst、json.gz；
+        json/jsonl/csv 按记录流式写入压缩流，xlsx 本身已是压缩格式，不支持再压缩。
+        
         Args:
             data: 要保存的数据
             filename: 文件名（可选）
             data_type: 数据类型（用于生成默认文件名）
+            
+        Returns:
+            保存的文件路径，没有数据时返回 None
         """
         if not data:
             print("没有数据需要保存")
-            return
+            return None
         
         # 生成文件名
         if not filename:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"{data_type}_{timestamp}"
         
-        filepath = os.path.join(self.data_dir, filename)
+        filepath = os.path.join(self.data_dir, filename) + f'.{self.output_format}'
         
         # 根据格式保存
-        if self.output_format == 'json':
-            filepath += '.json'
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        
-        elif self.output_format == 'csv':
-            filepath += '.csv'
-            df = pd.DataFrame(data)
-            df.to_csv(filepath, index=False, encoding='utf-8-sig')
-        
-        elif self.output_format == 'xlsx':
-            filepath += '.xlsx'
-            df = pd.DataFrame(data)
-            df.to_excel(filepath, index=False, engine='openpyxl')
+        with profiler.stage(f'save_{self._file_format}'):
+            self._write_records(data, filepath, self._file_format, self._compression)
         
         print(f"数据已保存到: {filepath}")
         print(f"共保存 {len(data)} 条记录")
+        return filepath
     
-    def flatten_shop_data(self, shops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _write_records(self, data: Iterable[Dict[str, Any]], filepath: str, output_format: str, compression: str):
+        """
+        按格式写入记录
+        
+        Args:
+            data: 要保存的数据
+            filepath: 完整文件路径
+            output_format: 输出格式（json, jsonl, csv, xlsx）
+            compression: 压缩后缀（gz、zst），为空表示不压缩
+        """
+        if output_format == 'json':
+            with _open_output(filepath, compression, 'utf-8') as f:
+                f.write('[\n')
+                for i, record in enumerate(data):
+                    if i:
+                        f.write(',\n')
+                    f.write(textwrap.indent(json.dumps(record, ensure_ascii=False, indent=2), '  '))
+                f.write('\n]')
+        
+        elif output_format == 'jsonl':
+            with _open_output(filepath, compression, 'utf-8') as f:
+                for record in data:
+                    f.write(json.dumps(record, ensure_ascii=False))
+                    f.write('\n')
+        
+        elif output_format == 'csv':
+            fieldnames = _fieldnames(data)
+            with _open_output(filepath, compression, 'utf-8-sig') as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(data)
+        
+        elif output_format == 'xlsx':
+            # 始终使用流式写入：无论数据是否已溢写到磁盘，相同的记录都生成相同的文件，且不整体载入内存
+            fieldnames = _fieldnames(data)
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(fieldnames)
+            for record in data:
+                sheet.append([_excel_value(record.get(key)) for key in fieldnames])
+            workbook.save(filepath)
+    
+    def flatten_shop_data(self, shops: Iterable[Dict[str, Any]]) -> RecordBuffer:
         """
         扁平化商户数据（便于导出到Excel/CSV）
         
@@ -186,25 +446,26 @@ class DataCollector:
         Returns:
             扁平化后的数据列表
         """
-        flattened = []
-        
-        for shop in shops:
-            flat_shop = {
-                'shop_id': shop.get('shop_id', ''),
-                'name': shop.get('name', ''),
-                'address': shop.get('address', ''),
-                'phone': shop.get('phone', ''),
-                'rating': shop.get('rating', ''),
-                'review_count': shop.get('review_count', 0),
-                'price': shop.get('price', ''),
-                'category': shop.get('category', ''),
-                'region': shop.get('region', ''),
-                'latitude': shop.get('latitude', ''),
-                'longitude': shop.get('longitude', ''),
-                'open_time': shop.get('open_time', ''),
-                'url': shop.get('url', ''),
-            }
-            flattened.append(flat_shop)
+        with profiler.stage('flatten'):
+            flattened = RecordBuffer()
+            
+            for shop in shops:
+                flat_shop = {
+                    'shop_id': shop.get('shop_id', ''),
+                    'name': shop.get('name', ''),
+                    'address': shop.get('address', ''),
+                    'phone': shop.get('phone', ''),
+                    'rating': shop.get('rating', ''),
+                    'review_count': shop.get('review_count', 0),
+                    'price': shop.get('price', ''),
+                    'category': shop.get('category', ''),
+                    'region': shop.get('region', ''),
+                    'latitude': shop.get('latitude', ''),
+                    'longitude': shop.get('longitude', ''),
+                    'open_time': shop.get('open_time', ''),
+                    'url': shop.get('url', ''),
+                }
+                flattened.append(flat_shop)
         
         return flattened
 
@@ -3,48 +3,167 @@
 """
 import time
 import hashlib
-import hmac
-import urllib.parse
+import threading
+from collections import deque
 import requests
-from typing import Dict, List, Optional, Any
+from urllib3.util.request import ACCEPT_ENCODING as SUPPORTED_ENCODINGS
+from typing import Dict, List, Optional, Any, Tuple
 from config import Config
+from profiler import profiler
+
+
+class APIError(Exception):
+    """API请求失败"""
+    
+    def __init__(self, message: str, status_code: int = None, rejected: bool = None):
+        """
+        Args:
+            message: 错误信息
+            status_code: HTTP状态码（超时、连接失败等没有响应时为 None）
+            rejected: 是否为服务端拒绝了请求参数（不传则按状态码判断）
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        if rejected is None:
+            # 4xx 表示请求本身有问题，重试相同参数不会成功；429 限流和 5xx 属于临时故障
+            rejected = status_code is not None and 400 <= status_code < 500 and status_code != 429
+        self.rejected = rejected
+
+
+class RequestBudget:
+    """API调用预算（滑动时间窗口内的最大请求数）"""
+    
+    def __init__(self, max_requests: int = None, window: int = None):
+        """
+        初始化调用预算
+        
+        Args:
+            max_requests: 窗口内最多请求数，0 表示不限制
+            window: 窗口长度（秒）
+        """
+        self.max_requests = Config.API_BUDGET_REQUESTS if max_requests is None else max_requests
+        self.window = Config.API_BUDGET_WINDOW if window is None else window
+        self._calls = deque()
+        self._lock = threading.Lock()
+    
+    def _expire(self, now: float):
+        """清理窗口外的调用记录"""
+        while self._calls and self._calls[0] <= now - self.window:
+            self._calls.popleft()
+    
+    def remaining(self) -> int:
+        """
+        当前窗口内剩余的请求数
+        
+        Returns:
+            剩余请求数（不限制时返回 -1）
+        """
+        if not self.max_requests:
+            return -1
+        with self._lock:
+            self._expire(time.time())
+            return self.max_requests - len(self._calls)
+    
+    def wait_time(self) -> float:
+        """
+        距离下一个可用请求名额的等待时间
+        
+        Returns:
+            等待秒数，0 表示可以立即请求
+        """
+        if not self.max_requests:
+            return 0.0
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            if len(self._calls) < self.max_requests:
+                return 0.0
+            return self._calls[0] + self.window - now
+    
+    def acquire(self):
+        """占用一个请求名额，预算用尽时阻塞等待"""
+        if not self.max_requests:
+            return
+        while True:
+            with self._lock:
+                now = time.time()
+                self._expire(now)
+                if len(self._calls) < self.max_requests:
+                    self._calls.append(now)
+                    return
+                wait = self._calls[0] + self.window - now
+            time.sleep(wait)
 
 
 class DianpingAPI:
     """大众点评API客户端"""
     
-    def __init__(self, api_key: str = None, api_secret: str = None):
+    def __init__(self, api_key: str = None, api_secret: str = None, budget: RequestBudget = None):
         """
         初始化API客户端
         
         Args:
             api_key: API密钥
             api_secret: API密钥
+            budget: API调用预算（可选，不传则不限制）
         """
         self.api_key = api_key or Config.API_KEY
         self.api_secret = api_secret or Config.API_SECRET
         self.base_url = Config.BASE_URL
         self.timeout = Config.REQUEST_TIMEOUT
+        self.budget = budget
+        self.request_count = 0
+        # 复用连接，长时间运行时保持连接池温热
+        self.session = requests.Session()
+        # 显式协商压缩响应：默认声明 urllib3 能解码的全部编码（gzip、deflate，装了 brotli/zstandard 时含 br/zstd）
+        self.session.headers['Accept-Encoding'] = Config.ACCEPT_ENCODING or SUPPORTED_ENCODINGS
+        # 传输字节统计：网络上实际接收的字节数和解压后的字节数
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        # 签名热路径缓存：各方法的静态参数模板、参数名排序结果、签名后缀、当前秒的时间戳
+        self._templates = {}
+        self._key_orders = {}
+        self._sign_suffix = f"&key={self.api_secret}"
+        self._timestamp = (0, '0', 'timestamp=0')
         
-    def _generate_signature(self, params: Dict[str, Any]) -> str:
+    def _generate_signature(self, fragments: Dict[str, str], key_order: List[str]) -> str:
         """
         生成API签名
         
         Args:
-            params: 请求参数
+            fragments: 各参数预先拼接好的 "key=value" 片段
+            key_order: 排序后的参数名
             
         Returns:
             签名字符串
         """
-        # 按参数名排序
-        sorted_params = sorted(params.items())
-        # 构建查询字符串
-        query_string = '&'.join([f"{k}={v}" for k, v in sorted_params])
-        # 添加密钥
-        sign_string = f"{query_string}&key={self.api_secret}"
+        # 按参数名排序拼接查询字符串，再添加密钥
+        sign_string = '&'.join([fragments[k] for k in key_order]) + self._sign_suffix
         # 生成MD5签名
-        signature = hashlib.md5(sign_string.encode('utf-8')).hexdigest().upper()
-        return signature
+        return hashlib.md5(sign_string.encode('utf-8')).hexdigest().upper()
+    
+    def _request_template(self, method: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        获取方法对应的静态参数模板（首次调用时构建并缓存）
+        
+        Args:
+            method: API方法名
+            
+        Returns:
+            (静态参数, 预先拼接好的 "key=value" 签名片段)，调用方需复制后再修改
+        """
+        template = self._templates.get(method)
+        if template is None:
+            static_params = {
+                'appkey': self.api_key,
+                'method': method,
+                'format': 'json',
+                'v': '1.0',
+            }
+            fragments = {k: f"{k}={v}" for k, v in static_params.items()}
+            template = (static_params, fragments)
+            self._templates[method] = template
+        return template
     
     def _build_request_params(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -57,17 +176,32 @@ class DianpingAPI:
         Returns:
             完整的请求参数
         """
-        request_params = {
-            'appkey': self.api_key,
-            'method': method,
-            'timestamp': str(int(time.time())),
-            'format': 'json',
-            'v': '1.0',
-            **params
-        }
+        static_params, static_fragments = self._request_template(method)
+        
+        # 时间戳及其签名片段在同一秒内复用
+        now = int(time.time())
+        timestamp = self._timestamp
+        if timestamp[0] != now:
+            timestamp = (now, str(now), f"timestamp={now}")
+            self._timestamp = timestamp
+        
+        request_params = static_params.copy()
+        request_params['timestamp'] = timestamp[1]
+        request_params.update(params)
+        
+        # 参数名集合只取决于业务参数的键，排序结果可以缓存
+        keys = tuple(params)
+        key_order = self._key_orders.get(keys)
+        if key_order is None:
+            key_order = sorted(request_params)
+            self._key_orders[keys] = key_order
         
-        # 生成签名
-        request_params['sign'] = self._generate_signature(request_params)
+        # 生成签名：静态参数使用预拼接片段，只格式化业务参数
+        fragments = static_fragments.copy()
+        fragments['timestamp'] = timestamp[2]
+        for k, v in params.items():
+            fragments[k] = f"{k}={v}"
+        request_params['sign'] = self._generate_signature(fragments, key_order)
         return request_params
     
     def _make_request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
@@ -81,18 +215,42 @@ class DianpingAPI:
         Returns:
             API响应数据
         """
-        request_params = self._build_request_params(method, params)
+        if self.budget:
+            self.budget.acquire()
+        with profiler.stage('sign'):
+            request_params = self._build_request_params(method, params)
+        self.request_count += 1
         
         try:
-            response = requests.post(
-                self.base_url,
-                data=request_params,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
-            return response.json()
+            with profiler.stage('network'):
+                response = self.session.post(
+                    self.base_url,
+                    data=request_params,
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                self._record_transfer(response)
+            with profiler.stage('json_decode'):
+                return response.json()
         except requests.exceptions.RequestException as e:
-            raise Exception(f"API请求失败: {str(e)}")
+            response = getattr(e, 'response', None)
+            raise APIError(f"API请求失败: {str(e)}", getattr(response, 'status_code', None))
+    
+    def _record_transfer(self, response: requests.Response):
+        """
+        记录响应的传输字节数
+        
+        Args:
+            response: 已完成的响应
+        """
+        decoded = len(response.content)
+        # urllib3 的 tell() 返回从网络读取的原始（压缩）字节数
+        tell = getattr(response.raw, 'tell', None)
+        received = tell() if tell else 0
+        if not received:
+            received = int(response.headers.get('Content-Length') or decoded)
+        self.bytes_received += received
+        self.bytes_decoded += decoded
     
     def search_shops(self, 
                      keyword: str = None,
@@ -0,0 +1,281 @@
+"""
+性能分析模块
+
+为命令行的各个处理阶段（网络请求、JSON解析、数据扁平化、文件写入、界面渲染）计时，
+并可选地同时运行 cProfile 或采样分析器，用于定位性能瓶颈。
+各模块通过全局实例 profiler 标记阶段，未启用时开销可以忽略。
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+
+PROFILER_MODES = ('cprofile', 'sample')
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    """单个阶段的计时上下文，记录包含子阶段的总耗时和自身耗时"""
+    
+    def __init__(self, profiler: 'StageProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        self.child_time = 0.0
+    
+    def __enter__(self):
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].child_time += elapsed
+        self.profiler._record(self.name, elapsed, elapsed - self.child_time)
+        return False
+
+
+class SamplingProfiler:
+    """基于后台线程的采样分析器，定期记录目标线程的调用栈"""
+    
+    def __init__(self, interval: float = 0.005, thread_id: int = None):
+        """
+        初始化采样分析器
+        
+        Args:
+            interval: 采样间隔（秒）
+            thread_id: 被采样的线程ID（默认为当前线程）
+        """
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _run(self):
+        """采样循环"""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+    
+    def start(self):
+        """开始采样"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止采样"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+    
+    def top_functions(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        按自身采样数排序的热点函数
+        
+        Args:
+            limit: 返回条数
+            
+        Returns:
+            [{'function', 'self_time', 'total_time', 'calls'}]，时间按采样数估算
+        """
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] += count
+            for function in set(stack):
+                total_counts[function] += count
+        
+        return [
+            {
+                'function': function,
+                'calls': None,
+                'self_time': count * self.interval,
+                'total_time': total_counts[function] * self.interval,
+            }
+            for function, count in self_counts.most_common(limit)
+        ]
+    
+    def save(self, filepath: str):
+        """
+        以 collapsed stacks 格式保存（可直接用于 flamegraph.pl / speedscope）
+        
+        Args:
+            filepath: 文件路径
+        """
+        with open(filepath, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+
+class StageProfiler:
+    """分阶段计时器，可选附带 cProfile 或采样分析"""
+    
+    def __init__(self):
+        self.enabled = False
+        self.mode = None
+        self.stages = {}
+        self.total_time = 0.0
+        self._local = threading.local()
+        self._start = 0.0
+        self._cprofile = None
+        self._sampler = None
+    
+    def _stack(self) -> List[_Stage]:
+        """当前线程的阶段栈"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+    
+    def _record(self, name: str, elapsed: float, self_time: float):
+        """累计阶段耗时"""
+        stats = self.stages.setdefault(name, {'calls': 0, 'total_time': 0.0, 'self_time': 0.0})
+        stats['calls'] += 1
+        stats['total_time'] += elapsed
+        stats['self_time'] += self_time
+    
+    def stage(self, name: str):
+        """
+        标记一个处理阶段
+        
+        用法:
+            with profiler.stage('network'):
+                ...
+                
+        Args:
+            name: 阶段名称
+            
+        Returns:
+            上下文管理器（未启用时为空操作）
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+    
+    def start(self, mode: str = None):
+        """
+        开始分析
+        
+        Args:
+            mode: 附加的分析器（cprofile、sample），为空时只做分阶段计时
+        """
+        if mode and mode not in PROFILER_MODES:
+            raise ValueError(f"未知的分析模式: {mode}")
+        
+        self.enabled = True
+        self.mode = mode
+        self.stages = {}
+        self._cprofile = None
+        self._sampler = None
+        if mode == 'cprofile':
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif mode == 'sample':
+            self._sampler = SamplingProfiler()
+            self._sampler.start()
+        self._start = time.perf_counter()
+    
+    def stop(self):
+        """结束分析"""
+        self.total_time = time.perf_counter() - self._start
+        if self._cprofile:
+            self._cprofile.disable()
+        if self._sampler:
+            self._sampler.stop()
+        self.enabled = False
+    
+    def stage_summary(self) -> List[Dict[str, Any]]:
+        """
+        各阶段耗时汇总（按自身耗时降序），附带未归入任何阶段的“其他”耗时
+        
+        Returns:
+            [{'stage', 'calls', 'total_time', 'self_time', 'share'}]
+        """
+        summary = [dict(stage=name, **stats) for name, stats in self.stages.items()]
+        staged = sum(item['self_time'] for item in summary)
+        summary.append({
+            'stage': 'other',
+            'calls': None,
+            'total_time': max(self.total_time - staged, 0.0),
+            'self_time': max(self.total_time - staged, 0.0),
+        })
+        for item in summary:
+            item['share'] = item['self_time'] / self.total_time if self.total_time else 0.0
+        summary.sort(key=lambda item: item['self_time'], reverse=True)
+        return summary
+    
+    def top_functions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        热点函数（按自身耗时降序）
+        
+        Args:
+            limit: 返回条数
+            
+        Returns:
+            [{'function', 'calls', 'self_time', 'total_time'}]，未启用附加分析器时为空
+        """
+        if self._sampler:
+            return self._sampler.top_functions(limit)
+        if not self._cprofile:
+            return []
+        
+        stats = pstats.Stats(self._cprofile).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        return [
+            {
+                'function': f"{func} ({os.path.basename(filename)}:{lineno})",
+                'calls': calls,
+                'self_time': self_time,
+                'total_time': total_time,
+            }
+            for (filename, lineno, func), (_, calls, self_time, total_time, _) in rows
+        ]
+    
+    def save(self, output_dir: str) -> Optional[str]:
+        """
+        保存原始分析数据
+        
+        Args:
+            output_dir: 输出目录
+            
+        Returns:
+            文件路径（.prof 可用 pstats/snakeviz 查看，.folded 可生成火焰图），未启用附加分析器时为 None
+        """
+        if not self._cprofile and not self._sampler:
+            return None
+        
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        if self._cprofile:
+            filepath = os.path.join(output_dir, f"profile_{timestamp}.prof")
+            self._cprofile.dump_stats(filepath)
+        else:
+            filepath = os.path.join(output_dir, f"profile_{timestamp}.folded")
+            self._sampler.save(filepath)
+        return filepath
+
+
+# 全局分析器实例，各模块通过 profiler.stage(...) 标记阶段
+profiler = StageProfiler()
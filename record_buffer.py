@@ -0,0 +1,172 @@
+"""
+记录缓冲模块
+
+收集结果先保存在内存中，估算占用超过 MEMORY_LIMIT_MB 后，将内存中的记录按列打包成一个
+行组（row group），压缩后追加写入磁盘临时文件。遍历时依次读回各行组，再返回内存中的记录，
+因此无论收集多少数据，内存中最多只保留约一个行组。
+"""
+import pickle
+import sys
+import tempfile
+import zlib
+from itertools import islice
+from typing import Dict, List, Any, Iterable, Iterator
+from config import Config
+
+
+class RecordBuffer:
+    """内存受限、超出上限后溢写到磁盘的记录列表"""
+    
+    def __init__(self, memory_limit_mb: float = None, spill_dir: str = None):
+        """
+        初始化记录缓冲
+        
+        Args:
+            memory_limit_mb: 内存上限（MB），0 表示不限制（不溢写）
+            spill_dir: 溢写临时文件目录（默认为系统临时目录）
+        """
+        limit = Config.MEMORY_LIMIT_MB if memory_limit_mb is None else memory_limit_mb
+        self.memory_limit = int(limit * 1024 * 1024)
+        self.spill_dir = spill_dir or Config.SPILL_DIR or None
+        # 所有记录的字段（按首次出现的顺序），导出 CSV/Excel 时用作列名
+        self.fields = {}
+        self._records = []
+        self._memory_bytes = 0
+        self._spill_file = None
+        self._row_groups = []  # [(偏移, 长度, 行数)]
+        self._spilled_count = 0
+    
+    @classmethod
+    def _estimate_size(cls, value: Any) -> int:
+        """估算记录占用的内存（递归计入嵌套的字典、列表和元组）"""
+        size = sys.getsizeof(value)
+        if isinstance(value, dict):
+            for key, item in value.items():
+                size += sys.getsizeof(key) + cls._estimate_size(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                size += cls._estimate_size(item)
+        return size
+    
+    def append(self, record: Dict[str, Any]):
+        """
+        追加一条记录
+        
+        Args:
+            record: 记录
+        """
+        for key in record:
+            if key not in self.fields:
+                self.fields[key] = None
+        self._records.append(record)
+        if self.memory_limit:
+            self._memory_bytes += self._estimate_size(record)
+            if self._memory_bytes >= self.memory_limit:
+                self.spill()
+    
+    def extend(self, records: Iterable[Dict[str, Any]]):
+        """
+        追加多条记录
+        
+        Args:
+            records: 记录列表
+        """
+        for record in records:
+            self.append(record)
+    
+    def spill(self):
+        """将内存中的记录按列打包为一个行组，压缩后写入磁盘"""
+        if not self._records:
+            return
+        
+        keys = list(dict.fromkeys(key for record in self._records for key in record))
+        columns = {key: [] for key in keys}
+        missing = {}
+        for i, record in enumerate(self._records):
+            for key in keys:
+                if key in record:
+                    columns[key].append(record[key])
+                else:
+                    columns[key].append(None)
+                    missing.setdefault(key, []).append(i)
+        
+        group = {'rows': len(self._records), 'columns': columns, 'missing': missing}
+        payload = zlib.compress(pickle.dumps(group, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix='records_', suffix='.spill', dir=self.spill_dir)
+        self._spill_file.seek(0, 2)
+        self._row_groups.append((self._spill_file.tell(), len(payload), len(self._records)))
+        self._spill_file.write(payload)
+        
+        self._spilled_count += len(self._records)
+        self._records = []
+        self._memory_bytes = 0
+    
+    @property
+    def spilled(self) -> bool:
+        """是否已有记录溢写到磁盘"""
+        return bool(self._row_groups)
+    
+    def _read_row_group(self, offset: int, length: int) -> List[Dict[str, Any]]:
+        """读回一个行组并还原为记录列表"""
+        self._spill_file.seek(offset)
+        group = pickle.loads(zlib.decompress(self._spill_file.read(length)))
+        columns = group['columns']
+        missing = {key: set(rows) for key, rows in group['missing'].items()}
+        
+        records = []
+        for i in range(group['rows']):
+            records.append({
+                key: values[i]
+                for key, values in columns.items()
+                if key not in missing or i not in missing[key]
+            })
+        return records
+    
+    def __len__(self) -> int:
+        return self._spilled_count + len(self._records)
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self._iter_from(0)
+    
+    def _iter_from(self, start: int) -> Iterator[Dict[str, Any]]:
+        """从第 start 条记录开始遍历，跳过之前的整个行组而不读取"""
+        for offset, length, rows in self._row_groups:
+            if start >= rows:
+                start -= rows
+                continue
+            yield from islice(self._read_row_group(offset, length), start, None)
+            start = 0
+        yield from islice(self._records, start, None)
+    
+    def __getitem__(self, index):
+        """支持非负下标和切片（如 records[:10]），只读取需要的行组"""
+        if isinstance(index, slice):
+            start = index.start or 0
+            if start < 0 or (index.stop is not None and index.stop < 0):
+                raise IndexError("RecordBuffer 不支持负数切片")
+            stop = None if index.stop is None else max(index.stop - start, 0)
+            return list(islice(self._iter_from(start), 0, stop, index.step))
+        if index < 0:
+            raise IndexError("RecordBuffer 不支持负数下标")
+        for record in self._iter_from(index):
+            return record
+        raise IndexError("记录下标超出范围")
+    
+    def close(self):
+        """删除溢写文件"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        self._row_groups = []
+        self._records = []
+        self._spilled_count = 0
+        self._memory_bytes = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
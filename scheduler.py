@@ -0,0 +1,306 @@
+"""
+定时调度模块
+
+以常驻进程方式运行周期性收集任务：任务持久化在 SQLite 中，
+按“过期程度 × 重要度”排序，热门商户刷新频繁、长尾商户刷新较少，
+所有任务共用一个 API 客户端和同一份调用预算。
+执行出错的任务不更新上次运行时间，按指数退避（最长一个刷新间隔）尽快重试。
+"""
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Any, Optional
+from config import Config
+from dianping_api import DianpingAPI, RequestBudget
+from data_collector import DataCollector, TASK_TYPES
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_type TEXT NOT NULL,
+    params TEXT NOT NULL,
+    importance REAL NOT NULL DEFAULT 1.0,
+    interval INTEGER NOT NULL,
+    last_run REAL,
+    last_status TEXT,
+    last_count INTEGER,
+    last_requests INTEGER,
+    failures INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL,
+    due_at REAL NOT NULL DEFAULT 0,
+    UNIQUE (task_type, params)
+)
+"""
+
+# 到期时间 = max(上次成功运行 + 刷新间隔, 出错后的退避结束时间)，在每次写入时维护，便于按索引查找到期任务
+DUE_AT = "MAX(COALESCE(last_run + interval, 0), COALESCE(retry_at, 0))"
+
+# 优先级：从未成功运行的任务优先，其次按 重要度 × 过期程度，得分相同时重要度高的优先
+PRIORITY = "last_run IS NULL DESC, importance * (? - last_run) / interval DESC, importance DESC, id"
+
+
+class CrawlScheduler:
+    """周期性收集任务调度器"""
+    
+    def __init__(self,
+                 collector: DataCollector = None,
+                 db_path: str = None,
+                 budget: RequestBudget = None):
+        """
+        初始化调度器
+        
+        Args:
+            collector: 数据收集器实例（不传则创建带预算的默认实例）
+            db_path: 任务库路径
+            budget: API调用预算
+        """
+        self.budget = budget or RequestBudget()
+        if collector is None:
+            collector = DataCollector(DianpingAPI(budget=self.budget))
+        self.collector = collector
+        self.db_path = db_path or Config.SCHEDULER_DB
+        
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(SCHEMA)
+        self._migrate()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks (due_at)")
+        self.conn.commit()
+    
+    def _migrate(self):
+        """为旧版本创建的任务库补充重试和到期时间相关的列"""
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(tasks)")}
+        if 'failures' not in columns:
+            self.conn.execute("ALTER TABLE tasks ADD COLUMN failures INTEGER NOT NULL DEFAULT 0")
+        if 'retry_at' not in columns:
+            self.conn.execute("ALTER TABLE tasks ADD COLUMN retry_at REAL")
+        if 'due_at' not in columns:
+            self.conn.execute("ALTER TABLE tasks ADD COLUMN due_at REAL NOT NULL DEFAULT 0")
+            self.conn.execute(f"UPDATE tasks SET due_at = {DUE_AT}")
+    
+    def add_task(self,
+                 task_type: str,
+                 params: Dict[str, Any],
+                 interval: int,
+                 importance: float = 1.0) -> int:
+        """
+        添加或更新任务（同类型同参数的任务只保留一个）
+        
+        Args:
+            task_type: 任务类型（search, detail, reviews, deals）
+            params: 收集参数
+            interval: 新鲜度目标，即期望的刷新间隔（秒）
+            importance: 重要度（大于 0），越大越优先
+            
+        Returns:
+            任务ID
+        """
+        if task_type not in TASK_TYPES:
+            raise ValueError(f"未知的任务类型: {task_type}")
+        if interval <= 0:
+            raise ValueError("刷新间隔必须大于 0")
+        if importance <= 0:
+            raise ValueError("重要度必须大于 0")
+        
+        params_json = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        self.conn.execute(
+            """
+            INSERT INTO tasks (task_type, params, importance, interval)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (task_type, params)
+            DO UPDATE SET importance = excluded.importance, interval = excluded.interval,
+                          due_at = MAX(COALESCE(last_run + excluded.interval, 0), COALESCE(retry_at, 0))
+            """,
+            (task_type, params_json, importance, interval)
+        )
+        self.conn.commit()
+        row = self.conn.execute(
+            "SELECT id FROM tasks WHERE task_type = ? AND params = ?",
+            (task_type, params_json)
+        ).fetchone()
+        return row['id']
+    
+    def remove_task(self, task_id: int) -> bool:
+        """
+        删除任务
+        
+        Args:
+            task_id: 任务ID
+            
+        Returns:
+            是否删除成功
+        """
+        cursor = self.conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        self.conn.commit()
+        return cursor.rowcount > 0
+    
+    def list_tasks(self) -> List[Dict[str, Any]]:
+        """
+        按优先级列出所有任务
+        
+        Returns:
+            任务列表（含 staleness 过期程度和 score 优先级得分）
+        """
+        now = time.time()
+        rows = self.conn.execute(f"SELECT * FROM tasks ORDER BY {PRIORITY}", (now,))
+        return [self._task(row, now) for row in rows]
+    
+    @classmethod
+    def _task(cls, row: sqlite3.Row, now: float) -> Dict[str, Any]:
+        """将任务行转换为任务记录，附带 staleness 和 score"""
+        task = dict(row)
+        task['params'] = json.loads(task['params'])
+        task['staleness'] = cls._staleness(task, now)
+        task['score'] = task['importance'] * task['staleness']
+        return task
+    
+    @staticmethod
+    def _staleness(task: Dict[str, Any], now: float) -> float:
+        """
+        计算任务的过期程度（距上次成功运行的时间 / 刷新间隔），从未成功运行过视为无限过期
+        
+        Args:
+            task: 任务记录
+            now: 当前时间戳
+            
+        Returns:
+            过期程度，>= 1 表示已到期
+        """
+        if task['last_run'] is None:
+            return float('inf')
+        return (now - task['last_run']) / task['interval']
+    
+    def due_tasks(self, limit: int = -1) -> List[Dict[str, Any]]:
+        """
+        按优先级列出当前到期的任务（已过刷新间隔且不在出错后的退避等待中）
+        
+        Args:
+            limit: 最多返回条数，-1 表示不限制
+            
+        Returns:
+            任务列表
+        """
+        now = time.time()
+        # 通过 due_at 索引只取出到期的任务再排序，未到期的长尾任务不参与计算
+        rows = self.conn.execute(
+            f"SELECT * FROM tasks WHERE due_at <= ? ORDER BY {PRIORITY} LIMIT ?",
+            (now, now, limit)
+        )
+        return [self._task(row, now) for row in rows]
+    
+    def next_due_task(self) -> Optional[Dict[str, Any]]:
+        """
+        取出优先级最高的到期任务
+        
+        Returns:
+            任务记录，没有到期任务时返回 None
+        """
+        tasks = self.due_tasks(limit=1)
+        return tasks[0] if tasks else None
+    
+    def seconds_until_next_due(self) -> Optional[float]:
+        """
+        距离最近一个任务到期的秒数（出错的任务以退避结束时间为准）
+        
+        Returns:
+            秒数，没有任务时返回 None
+        """
+        row = self.conn.execute("SELECT MIN(due_at) AS due FROM tasks").fetchone()
+        if row['due'] is None:
+            return None
+        return max(0.0, row['due'] - time.time())
+    
+    def run_task(self, task: Dict[str, Any], save: bool = True) -> int:
+        """
+        执行单个任务并记录结果
+        
+        出错时不更新上次运行时间，而是按 SCHEDULER_RETRY_SECONDS 指数退避后重试
+        （退避时间不超过刷新间隔），避免故障期间把任务误记为已刷新。
+        
+        Args:
+            task: 任务记录
+            save: 是否保存收集结果
+            
+        Returns:
+            收集到的记录数
+        """
+        requests_before = self.collector.api.request_count
+        try:
+            records, data_type = self.collector.collect_task(task['task_type'], task['params'], raise_errors=True)
+            if records and save:
+                self.collector.save_data(records, data_type=f"{data_type}_task{task['id']}")
+        except Exception as e:
+            print(f"任务 {task['id']} 执行失败: {str(e)}")
+            failures = task['failures'] + 1
+            backoff = min(Config.SCHEDULER_RETRY_SECONDS * 2 ** (failures - 1), task['interval'])
+            retry_at = time.time() + backoff
+            self.conn.execute(
+                """
+                UPDATE tasks
+                SET last_status = ?, last_requests = ?, failures = ?, retry_at = ?,
+                    due_at = MAX(COALESCE(last_run + interval, 0), ?)
+                WHERE id = ?
+                """,
+                ('error', self.collector.api.request_count - requests_before, failures,
+                 retry_at, retry_at, task['id'])
+            )
+            self.conn.commit()
+            return 0
+        
+        count = len(records)
+        now = time.time()
+        self.conn.execute(
+            """
+            UPDATE tasks
+            SET last_run = ?, last_status = ?, last_count = ?, last_requests = ?,
+                failures = 0, retry_at = NULL, due_at = ? + interval
+            WHERE id = ?
+            """,
+            (now, 'ok' if count else 'empty', count,
+             self.collector.api.request_count - requests_before, now, task['id'])
+        )
+        self.conn.commit()
+        return count
+    
+    def run(self, poll_interval: float = 60, once: bool = False, save: bool = True):
+        """
+        以常驻方式运行调度循环
+        
+        Args:
+            poll_interval: 没有到期任务时的最长休眠时间（秒）
+            once: 为 True 时只执行启动时已到期的任务后返回
+            save: 是否保存收集结果
+        """
+        if once:
+            # 只执行启动时已到期的任务，避免执行耗时超过刷新间隔的任务反复到期而无法退出
+            for task in self.due_tasks():
+                self._run_with_budget(task, save)
+            return
+        
+        while True:
+            task = self.next_due_task()
+            if task is None:
+                wait = self.seconds_until_next_due()
+                time.sleep(poll_interval if wait is None else min(wait, poll_interval))
+                continue
+            self._run_with_budget(task, save)
+    
+    def _run_with_budget(self, task: Dict[str, Any], save: bool):
+        """等待预算可用后执行任务"""
+        # 预算用尽时等待窗口释放，避免任务中途长时间阻塞
+        wait = self.budget.wait_time()
+        if wait > 0:
+            print(f"API预算已用尽，等待 {wait:.0f} 秒")
+            time.sleep(wait)
+        
+        print(f"执行任务 {task['id']} [{task['task_type']}] {task['params']}")
+        self.run_task(task, save=save)
+    
+    def close(self):
+        """关闭任务库连接"""
+        self.conn.close()
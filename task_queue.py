@@ -0,0 +1,554 @@
+"""
+分布式任务队列模块
+
+基于 SQLite 的共享任务队列，无需外部服务：协调进程负责投递任务和回收过期租约，
+任意数量的工作进程（同一台机器或共享文件系统的多台机器）以租约方式领取任务，
+通过心跳续约，完成后确认。工作进程崩溃后租约过期，任务会重新分配给其他进程，
+因此任务至少执行一次（at-least-once），同一任务可能产生重复结果。
+API调用预算也记录在队列库中，所有工作进程合计遵守同一份预算。
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+from config import Config
+from dianping_api import DianpingAPI, RequestBudget
+from data_collector import DataCollector, TASK_TYPES
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_type TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker_id TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result_count INTEGER,
+    last_error TEXT,
+    not_before REAL
+);
+CREATE INDEX IF NOT EXISTS idx_queue_status ON queue (status, lease_expires);
+"""
+
+BUDGET_SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_calls (
+    called_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_api_calls ON api_calls (called_at);
+"""
+
+# 任务状态
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def default_worker_id() -> str:
+    """生成工作进程ID（主机名-进程号）"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class TaskQueue:
+    """基于 SQLite 的租约式任务队列"""
+    
+    def __init__(self,
+                 db_path: str = None,
+                 lease_seconds: int = None,
+                 max_attempts: int = None,
+                 retry_seconds: float = None):
+        """
+        初始化任务队列
+        
+        Args:
+            db_path: 队列库路径（多台机器需位于共享文件系统上）
+            lease_seconds: 租约时长（秒）
+            max_attempts: 单个任务最多尝试次数
+            retry_seconds: 失败任务首次重试前的等待时间（秒），之后指数退避
+        """
+        self.db_path = db_path or Config.QUEUE_DB
+        self.lease_seconds = lease_seconds or Config.QUEUE_LEASE_SECONDS
+        self.max_attempts = max_attempts or Config.QUEUE_MAX_ATTEMPTS
+        self.retry_seconds = Config.QUEUE_RETRY_SECONDS if retry_seconds is None else retry_seconds
+        
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # isolation_level=None 以便手动控制事务；网络文件系统上不使用 WAL
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+    
+    def _migrate(self):
+        """为旧版本创建的队列库补充重试退避列"""
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(queue)")}
+        if 'not_before' not in columns:
+            self.conn.execute("ALTER TABLE queue ADD COLUMN not_before REAL")
+    
+    def _transaction(self):
+        """开启写事务，保证领取/回收任务的原子性"""
+        self.conn.execute("BEGIN IMMEDIATE")
+    
+    def enqueue(self, task_type: str, params: Dict[str, Any], max_attempts: int = None) -> int:
+        """
+        投递任务
+        
+        Args:
+            task_type: 任务类型（search, detail, reviews, deals）
+            params: 收集参数
+            max_attempts: 最多尝试次数（不传则使用默认值）
+            
+        Returns:
+            任务ID
+        """
+        if task_type not in TASK_TYPES:
+            raise ValueError(f"未知的任务类型: {task_type}")
+        
+        cursor = self._insert(task_type, params, max_attempts, time.time())
+        return cursor.lastrowid
+    
+    def _insert(self, task_type: str, params: Dict[str, Any], max_attempts: Optional[int], now: float):
+        """插入一条待处理任务"""
+        return self.conn.execute(
+            """
+            INSERT INTO queue (task_type, params, max_attempts, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (task_type, json.dumps(params, ensure_ascii=False, sort_keys=True),
+             max_attempts or self.max_attempts, now, now)
+        )
+    
+    def _reclaim_expired(self, now: float) -> int:
+        """将租约过期的任务重新置为待处理，超过尝试次数的标记为失败（需在事务中调用）"""
+        self.conn.execute(
+            """
+            UPDATE queue
+            SET status = ?, worker_id = NULL, lease_expires = NULL, updated_at = ?,
+                last_error = '租约过期'
+            WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts
+            """,
+            (FAILED, now, LEASED, now)
+        )
+        cursor = self.conn.execute(
+            """
+            UPDATE queue
+            SET status = ?, worker_id = NULL, lease_expires = NULL, updated_at = ?
+            WHERE status = ? AND lease_expires < ?
+            """,
+            (PENDING, now, LEASED, now)
+        )
+        return cursor.rowcount
+    
+    def reclaim_expired(self) -> int:
+        """
+        回收租约过期的任务（崩溃工作进程遗留的任务）
+        
+        Returns:
+            重新置为待处理的任务数
+        """
+        self._transaction()
+        try:
+            count = self._reclaim_expired(time.time())
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return count
+    
+    def lease(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        领取一个待处理任务
+        
+        Args:
+            worker_id: 工作进程ID
+            
+        Returns:
+            任务记录，队列为空时返回 None
+        """
+        now = time.time()
+        self._transaction()
+        try:
+            self._reclaim_expired(now)
+            # 跳过失败后仍在退避等待中的任务
+            row = self.conn.execute(
+                """
+                SELECT * FROM queue
+                WHERE status = ? AND (not_before IS NULL OR not_before <= ?)
+                ORDER BY id LIMIT 1
+                """,
+                (PENDING, now)
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            
+            self.conn.execute(
+                """
+                UPDATE queue
+                SET status = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1,
+                    updated_at = ?
+                WHERE id = ?
+                """,
+                (LEASED, worker_id, now + self.lease_seconds, now, row['id'])
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        
+        task = dict(row)
+        task['params'] = json.loads(task['params'])
+        task['attempts'] += 1
+        return task
+    
+    def heartbeat(self, task_id: int, worker_id: str) -> bool:
+        """
+        续约任务
+        
+        Args:
+            task_id: 任务ID
+            worker_id: 工作进程ID
+            
+        Returns:
+            是否仍持有租约（False 表示租约已过期并被回收）
+        """
+        now = time.time()
+        cursor = self.conn.execute(
+            """
+            UPDATE queue SET lease_expires = ?, updated_at = ?
+            WHERE id = ? AND worker_id = ? AND status = ?
+            """,
+            (now + self.lease_seconds, now, task_id, worker_id, LEASED)
+        )
+        return cursor.rowcount > 0
+    
+    def complete(self,
+                 task_id: int,
+                 worker_id: str,
+                 result_count: int = 0,
+                 follow_ups: List[Tuple[str, Dict[str, Any]]] = None) -> bool:
+        """
+        确认任务完成，并在同一事务中投递后续任务
+        
+        Args:
+            task_id: 任务ID
+            worker_id: 工作进程ID
+            result_count: 收集到的记录数
+            follow_ups: 后续任务 [(任务类型, 参数)]，仅在确认成功时投递
+            
+        Returns:
+            是否确认成功（租约已丢失时返回 False，任务可能被重复执行，后续任务不会投递）
+        """
+        for task_type, _ in follow_ups or []:
+            if task_type not in TASK_TYPES:
+                raise ValueError(f"未知的任务类型: {task_type}")
+        
+        now = time.time()
+        self._transaction()
+        try:
+            cursor = self.conn.execute(
+                """
+                UPDATE queue
+                SET status = ?, lease_expires = NULL, result_count = ?, updated_at = ?
+                WHERE id = ? AND worker_id = ? AND status = ?
+                """,
+                (DONE, result_count, now, task_id, worker_id, LEASED)
+            )
+            if cursor.rowcount == 0:
+                self.conn.execute("ROLLBACK")
+                return False
+            for task_type, params in follow_ups or []:
+                self._insert(task_type, params, None, now)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return True
+    
+    def fail(self, task_id: int, worker_id: str, error: str) -> bool:
+        """
+        报告任务失败，未超过尝试次数时重新排队
+        
+        重新排队的任务按 QUEUE_RETRY_SECONDS 指数退避（第 n 次失败后等待 QUEUE_RETRY_SECONDS × 2^(n-1) 秒）
+        才能再次被领取，避免服务故障期间在几秒内耗尽所有尝试次数。
+        
+        Args:
+            task_id: 任务ID
+            worker_id: 工作进程ID
+            error: 错误信息
+            
+        Returns:
+            是否报告成功
+        """
+        now = time.time()
+        cursor = self.conn.execute(
+            """
+            UPDATE queue
+            SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,
+                not_before = ? + ? * (1 << (attempts - 1)),
+                worker_id = NULL, lease_expires = NULL, last_error = ?, updated_at = ?
+            WHERE id = ? AND worker_id = ? AND status = ?
+            """,
+            (FAILED, PENDING, now, self.retry_seconds, error, now, task_id, worker_id, LEASED)
+        )
+        return cursor.rowcount > 0
+    
+    def stats(self) -> Dict[str, int]:
+        """
+        统计各状态的任务数
+        
+        Returns:
+            {状态: 任务数}
+        """
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for row in self.conn.execute("SELECT status, COUNT(*) AS n FROM queue GROUP BY status"):
+            counts[row['status']] = row['n']
+        return counts
+    
+    def list_tasks(self, status: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        列出任务
+        
+        Args:
+            status: 按状态过滤（可选）
+            limit: 最多返回条数
+            
+        Returns:
+            任务列表
+        """
+        if status:
+            rows = self.conn.execute(
+                "SELECT * FROM queue WHERE status = ? ORDER BY id LIMIT ?", (status, limit)
+            )
+        else:
+            rows = self.conn.execute("SELECT * FROM queue ORDER BY id LIMIT ?", (limit,))
+        
+        tasks = []
+        for row in rows:
+            task = dict(row)
+            task['params'] = json.loads(task['params'])
+            tasks.append(task)
+        return tasks
+    
+    def close(self):
+        """关闭队列库连接"""
+        self.conn.close()
+
+
+class SharedBudget(RequestBudget):
+    """
+    保存在队列库中的API调用预算，所有共享该队列的工作进程（包括其他机器上的）合计遵守同一份预算
+    
+    每次请求在写事务中清理窗口外的记录、检查并登记调用，因此多个进程之间不会超额。
+    """
+    
+    def __init__(self, db_path: str = None, max_requests: int = None, window: int = None):
+        """
+        初始化共享预算
+        
+        Args:
+            db_path: 队列库路径
+            max_requests: 窗口内最多请求数，0 表示不限制
+            window: 窗口长度（秒）
+        """
+        super().__init__(max_requests, window)
+        self.db_path = db_path or Config.QUEUE_DB
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(BUDGET_SCHEMA)
+    
+    def _check(self, reserve: bool) -> float:
+        """
+        清理窗口外的调用记录并检查剩余名额
+        
+        Args:
+            reserve: 有名额时是否登记一次调用
+            
+        Returns:
+            等待秒数，0 表示有可用名额
+        """
+        with self._lock:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM api_calls WHERE called_at <= ?", (now - self.window,))
+                count, oldest = self.conn.execute("SELECT COUNT(*), MIN(called_at) FROM api_calls").fetchone()
+                if count < self.max_requests:
+                    if reserve:
+                        self.conn.execute("INSERT INTO api_calls (called_at) VALUES (?)", (now,))
+                    wait = 0.0
+                else:
+                    wait = oldest + self.window - now
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return wait
+    
+    def remaining(self) -> int:
+        """当前窗口内所有进程合计剩余的请求数（不限制时返回 -1）"""
+        if not self.max_requests:
+            return -1
+        with self._lock:
+            now = time.time()
+            count = self.conn.execute(
+                "SELECT COUNT(*) FROM api_calls WHERE called_at > ?", (now - self.window,)
+            ).fetchone()[0]
+        return max(self.max_requests - count, 0)
+    
+    def wait_time(self) -> float:
+        """距离下一个可用请求名额的等待秒数，0 表示可以立即请求"""
+        if not self.max_requests:
+            return 0.0
+        return self._check(reserve=False)
+    
+    def acquire(self):
+        """占用一个请求名额，所有进程合计的预算用尽时阻塞等待"""
+        if not self.max_requests:
+            return
+        while True:
+            wait = self._check(reserve=True)
+            if not wait:
+                return
+            time.sleep(wait)
+    
+    def close(self):
+        """关闭预算库连接"""
+        self.conn.close()
+
+
+class QueueWorker:
+    """从共享队列领取并执行收集任务的工作进程"""
+    
+    def __init__(self,
+                 queue: TaskQueue = None,
+                 collector: DataCollector = None,
+                 worker_id: str = None):
+        """
+        初始化工作进程
+        
+        Args:
+            queue: 任务队列
+            collector: 数据收集器实例（默认使用保存在队列库中的共享预算）
+            worker_id: 工作进程ID（默认为 主机名-进程号）
+        """
+        self.queue = queue or TaskQueue()
+        self.collector = collector or DataCollector(DianpingAPI(budget=SharedBudget(self.queue.db_path)))
+        self.worker_id = worker_id or default_worker_id()
+    
+    def _heartbeat_loop(self, task_id: int, stop: threading.Event, lost: threading.Event):
+        """后台续约线程（SQLite 连接不能跨线程共享，单独建立连接）"""
+        queue = TaskQueue(self.queue.db_path, self.queue.lease_seconds, self.queue.max_attempts)
+        try:
+            while not stop.wait(self.queue.lease_seconds / 3):
+                if not queue.heartbeat(task_id, self.worker_id):
+                    lost.set()
+                    return
+        finally:
+            queue.close()
+    
+    @staticmethod
+    def _follow_ups(records: Iterable[Dict[str, Any]], expand: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """根据搜索结果为每个商户生成后续任务（detail/reviews）"""
+        shop_ids = [str(r['shop_id']) for r in records if r.get('shop_id')]
+        return [(task_type, {'shop_id': shop_id}) for shop_id in shop_ids for task_type in expand]
+    
+    def run_task(self, task: Dict[str, Any], save: bool = True) -> bool:
+        """
+        执行单个已领取的任务（执行期间后台续约）
+        
+        收集出错时报告失败，未超过尝试次数的任务会重新排队；
+        后续任务与完成确认在同一事务中投递，租约丢失时不会重复投递。
+        
+        Args:
+            task: 任务记录
+            save: 是否保存收集结果
+            
+        Returns:
+            是否成功确认完成
+        """
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop, args=(task['id'], stop, lost), daemon=True
+        )
+        heartbeat.start()
+        
+        params = dict(task['params'])
+        expand = params.pop('expand', [])
+        error = None
+        follow_ups = []
+        try:
+            records, data_type = self.collector.collect_task(task['task_type'], params, raise_errors=True)
+            if records and save:
+                self.collector.save_data(records, data_type=f"{data_type}_q{task['id']}")
+            if expand:
+                follow_ups = self._follow_ups(records, expand)
+        except Exception as e:
+            error = str(e)
+        finally:
+            stop.set()
+            heartbeat.join()
+        
+        if error is not None:
+            print(f"任务 {task['id']} 执行失败: {error}")
+            self.queue.fail(task['id'], self.worker_id, error)
+            return False
+        if not self.queue.complete(task['id'], self.worker_id, len(records), follow_ups):
+            print(f"任务 {task['id']} 的租约已丢失，可能已被其他工作进程重复执行")
+            return False
+        if follow_ups:
+            print(f"任务 {task['id']} 已投递 {len(follow_ups)} 个后续任务")
+        return True
+    
+    def run(self, poll_interval: float = 5, exit_when_empty: bool = False, save: bool = True):
+        """
+        循环领取并执行任务
+        
+        Args:
+            poll_interval: 队列为空时的轮询间隔（秒）
+            exit_when_empty: 队列中没有待处理任务时是否退出
+            save: 是否保存收集结果
+        """
+        print(f"工作进程 {self.worker_id} 已启动")
+        while True:
+            task = self.queue.lease(self.worker_id)
+            if task is None:
+                # 仍有退避等待中的任务时不算队列已空
+                if exit_when_empty and not self.queue.stats()[PENDING]:
+                    print(f"工作进程 {self.worker_id} 队列已空，退出")
+                    return
+                time.sleep(poll_interval)
+                continue
+            
+            print(f"[{self.worker_id}] 执行任务 {task['id']} [{task['task_type']}] "
+                  f"{task['params']}（第 {task['attempts']} 次尝试）")
+            self.run_task(task, save=save)
+
+
+def run_worker(db_path: str = None, poll_interval: float = 5,
+               exit_when_empty: bool = False, save: bool = True):
+    """
+    工作进程入口（供 multiprocessing 启动，每个进程独立建立连接和API客户端）
+    
+    Args:
+        db_path: 队列库路径
+        poll_interval: 队列为空时的轮询间隔（秒）
+        exit_when_empty: 队列为空时是否退出
+        save: 是否保存收集结果
+    """
+    worker = QueueWorker(TaskQueue(db_path))
+    try:
+        worker.run(poll_interval=poll_interval, exit_when_empty=exit_when_empty, save=save)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.queue.close()
@@ -0,0 +1,111 @@
+"""
+测试公共配置
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from dianping_api import APIError
+
+
+class FakeAPI:
+    """
+    假API客户端
+    
+    按页返回编号从 1 开始的商户，可模拟服务端截断页大小、拒绝过大页大小、分页元数据、
+    服务不可用和慢请求。
+    """
+    
+    def __init__(self, total=3, cap=1000, metadata=None, reject_above=None, reject_with='status',
+                 down=False, delay=0.0, fail_calls=()):
+        """
+        Args:
+            total: 商户总数
+            cap: 服务端静默截断的页大小
+            metadata: 分页元数据（total、has_more），为空时不返回
+            reject_above: 拒绝超过该值的页大小
+            reject_with: 拒绝方式（status 返回 400，body 返回不含 data 的错误码响应）
+            down: 为 True 时所有请求返回 503
+            delay: 每次请求的耗时（秒）
+            fail_calls: 超时失败的请求序号（从 1 开始）
+        """
+        self.total = total
+        self.cap = cap
+        self.metadata = metadata
+        self.reject_above = reject_above
+        self.reject_with = reject_with
+        self.down = down
+        self.delay = delay
+        self.fail_calls = set(fail_calls)
+        self.calls = []
+        self.request_count = 0
+    
+    def _request(self):
+        self.request_count += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.down:
+            raise APIError("API请求失败: 503 Service Unavailable", 503)
+        if self.request_count in self.fail_calls:
+            raise APIError("API请求失败: Read timed out")
+    
+    def search_shops(self, page, page_size, **kwargs):
+        self.calls.append((page, page_size))
+        self._request()
+        if self.reject_above and page_size > self.reject_above:
+            if self.reject_with == 'body':
+                return {'code': 40001, 'msg': 'page_size 无效'}
+            raise APIError("API请求失败: 400 Bad Request", 400)
+        size = min(page_size, self.cap)
+        start = (page - 1) * size
+        data = {'shops': [
+            {'shop_id': i, 'name': f'店铺{i}'} for i in range(start + 1, min(start + size, self.total) + 1)
+        ]}
+        if self.metadata == 'total':
+            data['total'] = self.total
+        elif self.metadata == 'has_more':
+            data['has_more'] = start + size < self.total
+        return {'data': data}
+    
+    def get_shop_detail(self, shop_id):
+        self._request()
+        return {'data': {'shop_id': shop_id}}
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """所有输出写入临时目录"""
+    monkeypatch.setattr(Config, 'DATA_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def fake_api():
+    """假API客户端类，用法: fake_api(total=120, cap=50)"""
+    return FakeAPI
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    """在临时目录创建任务队列"""
+    from task_queue import TaskQueue
+    
+    def factory(**kwargs):
+        return TaskQueue(db_path=str(tmp_path / 'queue.db'), **kwargs)
+    return factory
+
+
+@pytest.fixture
+def make_scheduler(tmp_path):
+    """在临时目录创建使用指定API客户端的调度器"""
+    from data_collector import DataCollector
+    from scheduler import CrawlScheduler
+    
+    def factory(api):
+        return CrawlScheduler(DataCollector(api), db_path=str(tmp_path / 'scheduler.db'))
+    return factory
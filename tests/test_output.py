@@ -0,0 +1,102 @@
+"""
+输出格式检查与各格式写入测试
+"""
+import csv
+import gzip
+import io
+import json
+import os
+
+import pytest
+
+import data_collector
+from config import Config
+from data_collector import DataCollector, parse_output_format
+
+
+@pytest.mark.parametrize('output_format, expected', [
+    ('xlsx', ('xlsx', '')),
+    ('csv', ('csv', '')),
+    ('jsonl.gz', ('jsonl', 'gz')),
+    ('json.gz', ('json', 'gz')),
+])
+def test_parse_output_format(output_format, expected):
+    assert parse_output_format(output_format) == expected
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'jsonl.gzip', 'xlsx.gz', 'csv.'])
+def test_invalid_output_format_fails_before_any_request(monkeypatch, fake_api, output_format):
+    monkeypatch.setattr(Config, 'OUTPUT_FORMAT', output_format)
+    api = fake_api()
+    with pytest.raises(ValueError):
+        DataCollector(api)
+    assert api.request_count == 0
+
+
+def test_zst_without_zstandard_fails_before_any_request(monkeypatch, fake_api):
+    monkeypatch.setattr(data_collector, 'zstandard', None)
+    monkeypatch.setattr(Config, 'OUTPUT_FORMAT', 'csv.zst')
+    api = fake_api()
+    with pytest.raises(ValueError, match='zstandard'):
+        DataCollector(api)
+    assert api.request_count == 0
+
+
+RECORDS = [
+    {'shop_id': 1, 'name': '老北京火锅', 'tags': ['火锅', '老字号']},
+    {'shop_id': 2, 'name': '川味小馆', 'rating': 4.5},
+    {'shop_id': 3, 'name': 'Café "Zhang", 2F', 'location': {'lat': 39.9, 'lng': 116.4}},
+]
+
+
+def save(monkeypatch, output_format, records=RECORDS):
+    monkeypatch.setattr(Config, 'OUTPUT_FORMAT', output_format)
+    return DataCollector(object()).save_data(records, filename='out')
+
+
+def read_text(filepath):
+    opener = gzip.open if filepath.endswith('.gz') else open
+    with opener(filepath, 'rt', encoding='utf-8-sig', newline='') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('compression', ['', '.gz'])
+def test_json_round_trip(monkeypatch, compression):
+    filepath = save(monkeypatch, 'json' + compression)
+    assert filepath.endswith('out.json' + compression)
+    assert json.loads(read_text(filepath)) == RECORDS
+
+
+@pytest.mark.parametrize('compression', ['', '.gz'])
+def test_jsonl_round_trip(monkeypatch, compression):
+    filepath = save(monkeypatch, 'jsonl' + compression)
+    assert [json.loads(line) for line in read_text(filepath).splitlines()] == RECORDS
+
+
+@pytest.mark.parametrize('compression', ['', '.gz'])
+def test_csv_uses_union_of_fields(monkeypatch, compression):
+    filepath = save(monkeypatch, 'csv' + compression)
+    rows = list(csv.DictReader(io.StringIO(read_text(filepath))))
+    assert list(rows[0]) == ['shop_id', 'name', 'tags', 'rating', 'location']
+    assert rows[0]['rating'] == '' and rows[1]['rating'] == '4.5'
+    assert rows[2]['name'] == 'Café "Zhang", 2F'
+
+
+def test_gzip_output_is_compressed(monkeypatch):
+    records = [{'shop_id': i, 'name': '老北京火锅'} for i in range(1000)]
+    plain = save(monkeypatch, 'jsonl', records)
+    compressed = save(monkeypatch, 'jsonl.gz', records)
+    assert os.path.getsize(compressed) < os.path.getsize(plain) / 5
+    with gzip.open(compressed, 'rt', encoding='utf-8') as f:
+        assert len(f.readlines()) == 1000
+
+
+def test_zst_round_trip(monkeypatch):
+    zstandard = pytest.importorskip('zstandard')
+    filepath = save(monkeypatch, 'jsonl.zst')
+    with zstandard.open(filepath, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == RECORDS
+
+
+def test_empty_data_is_not_saved(monkeypatch):
+    assert save(monkeypatch, 'jsonl', []) is None
@@ -0,0 +1,89 @@
+"""
+分页与页大小探测测试
+"""
+import pytest
+
+from config import Config
+from data_collector import DataCollector
+from dianping_api import APIError
+
+
+def shop_ids(collector, **kwargs):
+    return [shop['shop_id'] for shop in collector.collect_shops(max_pages=50, **kwargs)]
+
+
+@pytest.mark.parametrize('total, cap', [(120, 50), (40, 20), (37, 1000), (250, 100), (0, 100)])
+def test_silent_cap_without_metadata_loses_nothing(total, cap, fake_api):
+    collector = DataCollector(fake_api(total, cap=cap))
+    assert shop_ids(collector) == list(range(1, total + 1))
+    # 第二次调用使用缓存的页大小，结果一致
+    assert shop_ids(collector) == list(range(1, total + 1))
+
+
+def test_cap_is_cached_only_after_confirmation(fake_api):
+    api = fake_api(120, cap=50)
+    collector = DataCollector(api)
+    shop_ids(collector)
+    assert collector._page_sizes['shop.search'] == 50
+    assert api.calls == [(1, 100), (2, 50), (3, 50)]
+
+
+def test_single_short_page_is_not_cached(fake_api):
+    api = fake_api(37)
+    collector = DataCollector(api)
+    shop_ids(collector)
+    assert 'shop.search' not in collector._page_sizes
+    assert api.calls == [(1, 100), (2, 37)]
+
+
+@pytest.mark.parametrize('metadata', ['total', 'has_more'])
+def test_metadata_stops_without_empty_page(metadata, fake_api):
+    api = fake_api(250, cap=50, metadata=metadata)
+    collector = DataCollector(api)
+    assert shop_ids(collector) == list(range(1, 250 + 1))
+    assert api.calls == [(1, 100), (2, 50), (3, 50), (4, 50), (5, 50)]
+    assert collector._page_sizes['shop.search'] == 50
+
+
+@pytest.mark.parametrize('reject_with', ['status', 'body'])
+def test_rejected_page_size_is_halved(fake_api, reject_with):
+    api = fake_api(130, reject_above=40, reject_with=reject_with)
+    collector = DataCollector(api)
+    assert shop_ids(collector) == list(range(1, 130 + 1))
+    assert collector._page_sizes['shop.search'] == 25
+    assert api.calls[:3] == [(1, 100), (1, 50), (1, 25)]
+
+
+def test_transient_error_while_probing_does_not_halve(fake_api):
+    api = fake_api(120, fail_calls={1})
+    collector = DataCollector(api)
+    assert shop_ids(collector) == []
+    assert api.calls == [(1, 100)]
+    assert 'shop.search' not in collector._page_sizes
+    
+    # 下一次收集重新从 MAX_PAGE_SIZE 开始探测
+    assert shop_ids(collector) == list(range(1, 120 + 1))
+    assert api.calls[1:] == [(1, 100), (2, 100)]
+
+
+@pytest.mark.parametrize('failure', [{'fail_calls': {1}}, {'down': True}])
+def test_transient_error_while_probing_is_raised(fake_api, failure):
+    api = fake_api(120, **failure)
+    collector = DataCollector(api)
+    with pytest.raises(APIError):
+        collector.collect_shops(raise_errors=True)
+    assert api.calls == [(1, 100)]
+    assert 'shop.search' not in collector._page_sizes
+
+
+def test_explicit_page_size_with_silent_cap(fake_api):
+    collector = DataCollector(fake_api(40, cap=20))
+    assert shop_ids(collector, page_size=Config.DEFAULT_PAGE_SIZE * 2) == list(range(1, 40 + 1))
+
+
+def test_max_pages_limits_requests(fake_api):
+    api = fake_api(1000)
+    collector = DataCollector(api)
+    shops = collector.collect_shops(max_pages=2)
+    assert len(shops) == 200
+    assert len(api.calls) == 2
@@ -0,0 +1,97 @@
+"""
+分阶段计时与附加分析器测试
+"""
+import time
+
+import pytest
+
+from profiler import StageProfiler
+
+
+class FakeClock:
+    """手动推进的 perf_counter"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+    
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, 'perf_counter', clock)
+    return clock
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = StageProfiler()
+    with profiler.stage('network'):
+        pass
+    assert profiler.stages == {}
+
+
+def test_nested_stages_split_inclusive_and_self_time(clock):
+    profiler = StageProfiler()
+    profiler.start()
+    with profiler.stage('save_xlsx'):
+        clock.advance(1.0)
+        with profiler.stage('flatten'):
+            clock.advance(2.0)
+        clock.advance(0.5)
+    for _ in range(2):
+        with profiler.stage('network'):
+            clock.advance(3.0)
+    clock.advance(1.25)
+    profiler.stop()
+    
+    assert profiler.total_time == pytest.approx(10.75)
+    assert profiler.stages['save_xlsx'] == {'calls': 1, 'total_time': pytest.approx(3.5), 'self_time': pytest.approx(1.5)}
+    assert profiler.stages['flatten'] == {'calls': 1, 'total_time': pytest.approx(2.0), 'self_time': pytest.approx(2.0)}
+    assert profiler.stages['network'] == {'calls': 2, 'total_time': pytest.approx(6.0), 'self_time': pytest.approx(6.0)}
+    
+    summary = {item['stage']: item for item in profiler.stage_summary()}
+    assert [item['stage'] for item in profiler.stage_summary()] == ['network', 'flatten', 'save_xlsx', 'other']
+    assert summary['other']['self_time'] == pytest.approx(1.25)
+    assert sum(item['share'] for item in summary.values()) == pytest.approx(1.0)
+
+
+def test_restart_clears_previous_run(clock):
+    profiler = StageProfiler()
+    profiler.start()
+    with profiler.stage('network'):
+        clock.advance(1.0)
+    profiler.stop()
+    
+    profiler.start()
+    profiler.stop()
+    assert profiler.stages == {}
+    assert profiler.top_functions() == []
+    assert profiler.save('.') is None
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+@pytest.mark.parametrize('mode, suffix', [('cprofile', '.prof'), ('sample', '.folded')])
+def test_attached_profiler_reports_hot_functions(tmp_path, mode, suffix):
+    profiler = StageProfiler()
+    profiler.start(mode)
+    busy(0.1)
+    profiler.stop()
+    
+    functions = profiler.top_functions(50)
+    assert any(item['function'].startswith('busy ') for item in functions)
+    assert profiler.save(str(tmp_path)).endswith(suffix)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        StageProfiler().start('perf')
@@ -0,0 +1,97 @@
+"""
+记录缓冲溢写与读回测试
+"""
+import json
+
+import pytest
+
+from config import Config
+from data_collector import DataCollector
+from record_buffer import RecordBuffer
+
+
+def make_records(n):
+    records = []
+    for i in range(n):
+        record = {'shop_id': i, 'name': f'店铺{i}', 'tags': ['火锅', '川菜'], 'location': {'lat': 39.9, 'lng': 116.4}}
+        if i % 3 == 0:
+            record['phone'] = f'010-{i:08d}'
+        records.append(record)
+    return records
+
+
+def test_spill_round_trip(tmp_path):
+    records = make_records(1000)
+    with RecordBuffer(memory_limit_mb=0.05, spill_dir=str(tmp_path)) as buffer:
+        buffer.extend(records)
+        assert buffer.spilled
+        assert len(buffer) == 1000
+        assert list(buffer) == records
+        assert list(buffer.fields) == ['shop_id', 'name', 'tags', 'location', 'phone']
+        # 缺失字段读回后仍然缺失，而不是变成 None
+        assert 'phone' not in buffer[1]
+
+
+def test_indexing_and_slicing_across_row_groups(tmp_path):
+    records = make_records(500)
+    buffer = RecordBuffer(memory_limit_mb=0.02, spill_dir=str(tmp_path))
+    buffer.extend(records)
+    assert len(buffer._row_groups) > 2
+    
+    assert buffer[0] == records[0]
+    assert buffer[499] == records[499]
+    assert buffer[:10] == records[:10]
+    assert buffer[123:321:7] == records[123:321:7]
+    with pytest.raises(IndexError):
+        buffer[500]
+    with pytest.raises(IndexError):
+        buffer[-1]
+
+
+def test_no_limit_never_spills():
+    buffer = RecordBuffer(memory_limit_mb=0)
+    buffer.extend(make_records(1000))
+    assert not buffer.spilled
+    assert len(buffer) == 1000
+
+
+def test_nested_values_count_towards_limit(tmp_path):
+    nested = {'shop_id': 1, 'reviews': [{'content': '味道很好' * 50, 'photos': ['x' * 200] * 5}] * 20}
+    flat = {'shop_id': 1, 'reviews': []}
+    assert RecordBuffer._estimate_size(nested) > 20 * RecordBuffer._estimate_size(flat)
+    
+    buffer = RecordBuffer(memory_limit_mb=0.5, spill_dir=str(tmp_path))
+    buffer.extend([nested] * 50)
+    assert buffer.spilled
+
+
+def test_save_from_spilled_buffer(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'OUTPUT_FORMAT', 'jsonl')
+    records = make_records(300)
+    buffer = RecordBuffer(memory_limit_mb=0.02, spill_dir=str(tmp_path))
+    buffer.extend(records)
+    
+    filepath = DataCollector(object()).save_data(buffer, filename='shops.jsonl')
+    with open(filepath, encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == records
+
+
+def test_xlsx_is_identical_whether_or_not_spilled(tmp_path, monkeypatch):
+    openpyxl = pytest.importorskip('openpyxl')
+    monkeypatch.setattr(Config, 'OUTPUT_FORMAT', 'xlsx')
+    records = make_records(300)
+    collector = DataCollector(object())
+    
+    def cells(buffer, filename):
+        buffer.extend(records)
+        filepath = collector.save_data(buffer, filename=filename)
+        return list(openpyxl.load_workbook(filepath).active.values)
+    
+    spilled = RecordBuffer(memory_limit_mb=0.02, spill_dir=str(tmp_path))
+    in_memory = RecordBuffer(memory_limit_mb=0)
+    rows = cells(in_memory, 'memory')
+    assert cells(spilled, 'spilled') == rows
+    assert spilled.spilled and not in_memory.spilled
+    assert rows[0] == ('shop_id', 'name', 'tags', 'location', 'phone')
+    assert rows[1] == (0, '店铺0', '["火锅", "川菜"]', '{"lat": 39.9, "lng": 116.4}', '010-00000000')
+    assert rows[2][4] is None
@@ -0,0 +1,115 @@
+"""
+调度器到期判断、出错重试与单次运行测试
+"""
+import sqlite3
+import time
+
+import pytest
+
+from config import Config
+
+
+@pytest.mark.parametrize('importance', [0, -1])
+def test_non_positive_importance_is_rejected(importance, fake_api, make_scheduler):
+    scheduler = make_scheduler(fake_api())
+    with pytest.raises(ValueError):
+        scheduler.add_task('detail', {'shop_id': '1'}, interval=60, importance=importance)
+
+
+def test_error_backs_off_without_marking_task_fresh(monkeypatch, fake_api, make_scheduler):
+    monkeypatch.setattr(Config, 'SCHEDULER_RETRY_SECONDS', 10)
+    api = fake_api(down=True)
+    scheduler = make_scheduler(api)
+    scheduler.add_task('detail', {'shop_id': '1'}, interval=3600)
+    
+    scheduler.run(once=True, save=False)
+    task = scheduler.list_tasks()[0]
+    assert task['last_status'] == 'error'
+    assert task['last_run'] is None
+    assert task['failures'] == 1
+    assert scheduler.next_due_task() is None
+    assert 0 < scheduler.seconds_until_next_due() <= 10
+    
+    # 退避结束后重试，成功则按刷新间隔调度
+    scheduler.conn.execute("UPDATE tasks SET retry_at = ?, due_at = ?", (time.time() - 1, time.time() - 1))
+    api.down = False
+    scheduler.run(once=True, save=False)
+    task = scheduler.list_tasks()[0]
+    assert task['last_status'] == 'ok'
+    assert task['failures'] == 0 and task['retry_at'] is None
+    assert scheduler.seconds_until_next_due() > 3000
+
+
+def test_backoff_grows_and_is_capped_by_interval(monkeypatch, fake_api, make_scheduler):
+    monkeypatch.setattr(Config, 'SCHEDULER_RETRY_SECONDS', 10)
+    scheduler = make_scheduler(fake_api(down=True))
+    scheduler.add_task('detail', {'shop_id': '1'}, interval=25)
+    
+    waits = []
+    for _ in range(3):
+        scheduler.run_task(scheduler.list_tasks()[0], save=False)
+        waits.append(scheduler.list_tasks()[0]['retry_at'] - time.time())
+    assert [round(w) for w in waits] == [10, 20, 25]
+
+
+def test_run_once_exits_when_tasks_outlast_their_interval(fake_api, make_scheduler):
+    api = fake_api(delay=0.05)
+    scheduler = make_scheduler(api)
+    scheduler.add_task('detail', {'shop_id': '1'}, interval=1)
+    scheduler.add_task('detail', {'shop_id': '2'}, interval=1)
+    scheduler.conn.execute("UPDATE tasks SET interval = 0.01")
+    
+    scheduler.run(once=True, save=False)
+    assert api.request_count == 2
+
+
+def test_due_tasks_are_ranked_by_staleness_times_importance(fake_api, make_scheduler):
+    scheduler = make_scheduler(fake_api())
+    now = time.time()
+    ids = {}
+    for shop_id, interval, importance, age in [
+        ('fresh', 3600, 10, 60),        # 未到期
+        ('stale', 100, 1, 300),         # 过期程度 3，得分 3
+        ('important', 100, 2, 200),     # 过期程度 2，得分 4
+        ('never', 100, 1, None),        # 从未运行，最优先
+    ]:
+        ids[shop_id] = scheduler.add_task('detail', {'shop_id': shop_id}, interval=interval, importance=importance)
+        if age is not None:
+            scheduler.conn.execute(
+                "UPDATE tasks SET last_run = ?, due_at = ? WHERE id = ?",
+                (now - age, now - age + interval, ids[shop_id])
+            )
+    
+    assert [t['id'] for t in scheduler.due_tasks()] == [ids['never'], ids['important'], ids['stale']]
+    assert scheduler.next_due_task()['id'] == ids['never']
+    
+    # 缩短刷新间隔后重新计算到期时间
+    scheduler.add_task('detail', {'shop_id': 'fresh'}, interval=30, importance=10)
+    assert scheduler.due_tasks()[1]['id'] == ids['fresh']
+
+
+def test_due_lookup_uses_index(fake_api, make_scheduler):
+    scheduler = make_scheduler(fake_api())
+    plan = scheduler.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM tasks WHERE due_at <= ?", (time.time(),)
+    ).fetchall()
+    assert any('idx_tasks_due' in row['detail'] for row in plan)
+
+
+def test_existing_database_is_migrated(tmp_path, fake_api, make_scheduler):
+    conn = sqlite3.connect(str(tmp_path / 'scheduler.db'))
+    conn.execute(
+        "CREATE TABLE tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, task_type TEXT NOT NULL, "
+        "params TEXT NOT NULL, importance REAL NOT NULL DEFAULT 1.0, interval INTEGER NOT NULL, "
+        "last_run REAL, last_status TEXT, last_count INTEGER, last_requests INTEGER, UNIQUE (task_type, params))"
+    )
+    conn.execute(
+        "INSERT INTO tasks (task_type, params, interval, last_run) VALUES ('detail', '{\"shop_id\": \"1\"}', 60, ?)",
+        (time.time(),)
+    )
+    conn.commit()
+    conn.close()
+    
+    scheduler = make_scheduler(fake_api())
+    assert scheduler.next_due_task() is None
+    assert 50 < scheduler.seconds_until_next_due() <= 60
@@ -0,0 +1,66 @@
+"""
+请求签名与原始算法一致性测试
+"""
+import hashlib
+import time
+
+import pytest
+
+from dianping_api import DianpingAPI
+
+
+TIMESTAMP = 1700000000
+
+
+def original_sign(api, method, params, timestamp):
+    """优化前的签名算法：拼装全部参数，按 items() 排序后计算 MD5"""
+    request_params = {
+        'appkey': api.api_key,
+        'method': method,
+        'timestamp': str(timestamp),
+        'format': 'json',
+        'v': '1.0',
+        **params
+    }
+    query_string = '&'.join([f"{k}={v}" for k, v in sorted(request_params.items())])
+    sign_string = f"{query_string}&key={api.api_secret}"
+    request_params['sign'] = hashlib.md5(sign_string.encode('utf-8')).hexdigest().upper()
+    return request_params
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(time, 'time', lambda: TIMESTAMP + 0.5)
+    return DianpingAPI(api_key='test_key', api_secret='test_secret')
+
+
+@pytest.mark.parametrize('method, params', [
+    ('shop.search', {'keyword': '火锅', 'city': '北京', 'page': 3, 'page_size': 50}),
+    ('shop.search', {'page_size': 50, 'page': 3, 'city': '北京', 'keyword': '火锅'}),
+    ('shop.getDetail', {'shop_id': 12345678}),
+    ('review.getList', {'shop_id': '12345678', 'page': 1, 'page_size': 20}),
+    ('deal.search', {}),
+])
+def test_signature_matches_original_algorithm(api, method, params):
+    expected = original_sign(api, method, params, TIMESTAMP)
+    assert api._build_request_params(method, params) == expected
+    # 第二次调用命中模板和参数名排序缓存，结果不变
+    assert api._build_request_params(method, params) == expected
+
+
+def test_key_order_cache_is_per_key_set(api):
+    first = {'keyword': '火锅', 'page': 1, 'page_size': 20}
+    reordered = {'page_size': 20, 'keyword': '火锅', 'page': 1}
+    other_values = {'keyword': '烤鸭', 'page': 2, 'page_size': 50}
+    
+    for params in (first, reordered, other_values, first):
+        assert api._build_request_params('shop.search', params) == original_sign(api, 'shop.search', params, TIMESTAMP)
+    assert len(api._key_orders) == 2
+
+
+def test_timestamp_is_refreshed_each_second(api, monkeypatch):
+    params = {'shop_id': 1}
+    api._build_request_params('shop.getDetail', params)
+    monkeypatch.setattr(time, 'time', lambda: TIMESTAMP + 1.2)
+    expected = original_sign(api, 'shop.getDetail', params, TIMESTAMP + 1)
+    assert api._build_request_params('shop.getDetail', params) == expected
@@ -0,0 +1,117 @@
+"""
+任务队列租约、重试与后续任务投递测试
+"""
+import time
+
+from data_collector import DataCollector
+from task_queue import QueueWorker, SharedBudget, PENDING, LEASED, DONE, FAILED
+
+
+def test_expired_lease_is_redelivered(make_queue):
+    queue = make_queue(lease_seconds=60)
+    task_id = queue.enqueue('detail', {'shop_id': '1'})
+    
+    task = queue.lease('worker-a')
+    assert task['id'] == task_id and task['attempts'] == 1
+    assert queue.lease('worker-b') is None
+    
+    # 模拟 worker-a 崩溃：租约过期后任务重新分配
+    queue.conn.execute("UPDATE queue SET lease_expires = ?", (time.time() - 1,))
+    task = queue.lease('worker-b')
+    assert task['id'] == task_id and task['attempts'] == 2
+    
+    # worker-a 的心跳和确认都已失效
+    assert not queue.heartbeat(task_id, 'worker-a')
+    assert not queue.complete(task_id, 'worker-a')
+    assert queue.complete(task_id, 'worker-b', result_count=1)
+    assert queue.stats()[DONE] == 1
+
+
+def test_expired_lease_fails_after_max_attempts(make_queue):
+    queue = make_queue(max_attempts=1)
+    queue.enqueue('detail', {'shop_id': '1'})
+    queue.lease('worker-a')
+    queue.conn.execute("UPDATE queue SET lease_expires = ?", (time.time() - 1,))
+    
+    assert queue.lease('worker-b') is None
+    assert queue.list_tasks()[0]['status'] == FAILED
+
+
+def test_collection_error_requeues_task_with_backoff(fake_api, make_queue):
+    queue = make_queue(max_attempts=2, retry_seconds=10)
+    task_id = queue.enqueue('search', {'keyword': '火锅', 'city': '北京'})
+    worker = QueueWorker(queue, DataCollector(fake_api(down=True)), worker_id='worker-a')
+    
+    assert not worker.run_task(queue.lease(worker.worker_id), save=False)
+    task = queue.list_tasks()[0]
+    assert task['status'] == PENDING
+    assert task['attempts'] == 1
+    assert '503' in task['last_error']
+    assert round(task['not_before'] - time.time()) == 10
+    # 退避期间不会被立即重新领取
+    assert queue.lease(worker.worker_id) is None
+    
+    queue.conn.execute("UPDATE queue SET not_before = ?", (time.time() - 1,))
+    assert not worker.run_task(queue.lease(worker.worker_id), save=False)
+    task = queue.list_tasks()[0]
+    assert task['id'] == task_id
+    assert task['status'] == FAILED
+    assert task['attempts'] == 2
+
+
+def test_backoff_doubles_per_failure(make_queue):
+    queue = make_queue(max_attempts=5, retry_seconds=10)
+    queue.enqueue('detail', {'shop_id': '1'})
+    
+    waits = []
+    for _ in range(3):
+        queue.conn.execute("UPDATE queue SET not_before = NULL")
+        task = queue.lease('worker-a')
+        queue.fail(task['id'], 'worker-a', '503')
+        waits.append(queue.list_tasks()[0]['not_before'] - time.time())
+    assert [round(w) for w in waits] == [10, 20, 40]
+
+
+def test_follow_ups_are_enqueued_with_completion(fake_api, make_queue):
+    queue = make_queue()
+    queue.enqueue('search', {'keyword': '火锅', 'city': '北京', 'expand': ['detail']})
+    worker = QueueWorker(queue, DataCollector(fake_api(total=3)), worker_id='worker-a')
+    
+    assert worker.run_task(queue.lease(worker.worker_id), save=False)
+    tasks = queue.list_tasks()
+    assert tasks[0]['status'] == DONE
+    assert tasks[0]['result_count'] == 3
+    assert [(t['task_type'], t['params'], t['status']) for t in tasks[1:]] == [
+        ('detail', {'shop_id': str(i)}, PENDING) for i in (1, 2, 3)
+    ]
+
+
+def test_follow_ups_are_dropped_when_lease_is_lost(make_queue):
+    queue = make_queue()
+    task_id = queue.enqueue('search', {'keyword': '火锅', 'city': '北京'})
+    queue.lease('worker-a')
+    queue.conn.execute("UPDATE queue SET lease_expires = ?", (time.time() - 1,))
+    queue.lease('worker-b')
+    
+    assert not queue.complete(task_id, 'worker-a', 3, [('detail', {'shop_id': '1'})])
+    assert [t['status'] for t in queue.list_tasks()] == [LEASED]
+    
+    assert queue.complete(task_id, 'worker-b', 3, [('detail', {'shop_id': '1'})])
+    assert [t['status'] for t in queue.list_tasks()] == [DONE, PENDING]
+
+
+def test_budget_is_shared_between_workers(make_queue):
+    queue = make_queue()
+    first = SharedBudget(queue.db_path, max_requests=3, window=60)
+    second = SharedBudget(queue.db_path, max_requests=3, window=60)
+    
+    first.acquire()
+    first.acquire()
+    second.acquire()
+    assert first.remaining() == 0 and second.remaining() == 0
+    assert 0 < second.wait_time() <= 60
+    
+    # 窗口外的调用不再占用预算
+    first.conn.execute("UPDATE api_calls SET called_at = called_at - 61")
+    assert second.wait_time() == 0
+    assert first.remaining() == 3
@@ -0,0 +1,57 @@
+"""
+响应传输字节数统计测试
+"""
+import gzip
+import io
+import json
+
+import requests
+import urllib3
+
+from config import Config
+from dianping_api import DianpingAPI
+
+
+BODY = json.dumps({'data': {'shops': [{'shop_id': i, 'name': '老北京火锅'} for i in range(200)]}}).encode('utf-8')
+
+
+def make_response(body, headers):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.raw = urllib3.HTTPResponse(
+        body=io.BytesIO(body), headers=headers, preload_content=False, decode_content=True
+    )
+    return response
+
+
+def test_gzip_response_counts_wire_and_decoded_bytes():
+    api = DianpingAPI(api_key='key', api_secret='secret')
+    compressed = gzip.compress(BODY)
+    api._record_transfer(make_response(compressed, {'Content-Encoding': 'gzip'}))
+    assert api.bytes_received == len(compressed)
+    assert api.bytes_decoded == len(BODY)
+    assert api.bytes_received < api.bytes_decoded
+
+
+def test_plain_response_and_accumulation():
+    api = DianpingAPI(api_key='key', api_secret='secret')
+    for _ in range(2):
+        api._record_transfer(make_response(BODY, {'Content-Length': str(len(BODY))}))
+    assert api.bytes_received == api.bytes_decoded == 2 * len(BODY)
+
+
+def test_falls_back_to_content_length_without_raw_position():
+    api = DianpingAPI(api_key='key', api_secret='secret')
+    response = make_response(BODY, {'Content-Length': '123'})
+    response._content = BODY
+    response.raw = None
+    api._record_transfer(response)
+    assert api.bytes_received == 123
+    assert api.bytes_decoded == len(BODY)
+
+
+def test_accept_encoding_header(monkeypatch):
+    assert 'gzip' in DianpingAPI(api_key='key', api_secret='secret').session.headers['Accept-Encoding']
+    monkeypatch.setattr(Config, 'ACCEPT_ENCODING', 'identity')
+    assert DianpingAPI(api_key='key', api_secret='secret').session.headers['Accept-Encoding'] == 'identity'